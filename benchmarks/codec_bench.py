@@ -0,0 +1,68 @@
+# benchmarks/codec_bench.py
+"""Messages/seconde par codec (encodage + décodage d'un chat_message).
+
+Usage : python -m benchmarks.codec_bench [-n 200000]
+"""
+import argparse
+import json
+import time
+
+from codec import available_codecs, get_codec
+
+SAMPLE = {
+    "type": "chat_message",
+    "room": "general",
+    "from": "alice",
+    "message": "Salut tout le monde, quelqu'un a testé la nouvelle version ? 🙂",
+}
+
+
+def bench(codec, n):
+    line = codec.dumps(SAMPLE) + b"\n"
+
+    start = time.perf_counter()
+    for _ in range(n):
+        codec.dumps(SAMPLE) + b"\n"
+    encode = n / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        codec.loads(line)
+    decode = n / (time.perf_counter() - start)
+
+    return encode, decode
+
+
+def bench_legacy(n):
+    """Ancien chemin : str intermédiaires, decode()/strip() et concaténation."""
+    line = (json.dumps(SAMPLE) + "\n").encode()
+
+    start = time.perf_counter()
+    for _ in range(n):
+        (json.dumps(SAMPLE) + "\n").encode()
+    encode = n / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        json.loads(line.decode().strip())
+    decode = n / (time.perf_counter() - start)
+
+    return encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=200_000,
+                        help="nombre de messages par mesure")
+    args = parser.parse_args()
+
+    print(f"{'codec':<10}{'encode msg/s':>16}{'decode msg/s':>16}")
+    encode, decode = bench_legacy(args.n)
+    print(f"{'(ancien)':<10}{encode:>16,.0f}{decode:>16,.0f}")
+    for name in available_codecs():
+        encode, decode = bench(get_codec(name), args.n)
+        print(f"{name:<10}{encode:>16,.0f}{decode:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
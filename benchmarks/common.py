@@ -0,0 +1,64 @@
+# benchmarks/common.py
+"""Outils partagés par les benchmarks : lancer un serveur local, mesurer."""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, "server.py")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, extra_args=()):
+    """Lance server.py sur 127.0.0.1:port dans un sous-processus."""
+    return subprocess.Popen(
+        [sys.executable, SERVER, "--host", "127.0.0.1", "--port", str(port),
+         *extra_args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_for_server(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return
+
+
+def rss_bytes(pid):
+    """(RSS actuelle, RSS max) d'un processus en octets, (None, None) hors Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None, None
+
+    def kib(name):
+        value = fields.get(name)
+        return int(value.split()[0]) * 1024 if value else None
+
+    return kib("VmRSS"), kib("VmHWM")
+
+
+def percentile(sorted_values, q):
+    """Quantile q (0..1) d'une liste déjà triée, 0.0 si elle est vide."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
@@ -0,0 +1,146 @@
+# benchmarks/core_bench.py
+"""Compare les cœurs "stream" et "protocol" du serveur.
+
+Pour chaque cœur et chaque nombre de connexions, lance `server.py` dans un
+sous-processus, connecte N clients répartis dans des salons de
+--room-size membres, puis chaque client envoie --messages messages.
+On mesure le temps de connexion/inscription et le débit de livraison
+(messages reçus par seconde, tous clients confondus).
+
+Usage : python -m benchmarks.core_bench [--connections 1000 10000]
+
+Attention : 10k connexions demandent `ulimit -n` > 10 000 dans ce
+processus comme dans celui du serveur.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import free_port, start_server, wait_for_server
+
+
+class BenchClient:
+    def __init__(self, name, room):
+        self.name = name
+        self.room = room
+        self.received = 0
+        self.reader = None
+        self.writer = None
+
+    def send(self, payload):
+        self.writer.write((json.dumps(payload) + "\n").encode())
+
+    async def expect(self, mtype):
+        while True:
+            msg = json.loads(await self.reader.readline())
+            if msg.get("type") == mtype:
+                return msg
+            if msg.get("type") == "error":
+                raise RuntimeError(f"{self.name}: {msg['message']}")
+
+    async def setup(self, port, creator):
+        self.reader, self.writer = await asyncio.open_connection(
+            "127.0.0.1", port
+        )
+        self.send({"action": "register", "username": self.name})
+        await self.expect("info")
+        if creator:
+            self.send({"action": "create_room", "room": self.room})
+            # "room_added" (diffusé à tous) puis "info", la réponse
+            await self.expect("info")
+
+    async def join(self):
+        self.send({"action": "join_room", "room": self.room})
+        await self.expect("room_joined")
+
+    async def count_messages(self, expected, done):
+        while self.received < expected:
+            line = await self.reader.readline()
+            if not line:
+                break
+            self.received += 1
+        done()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def run_once(core, connections, room_size, messages):
+    port = free_port()
+    proc = start_server(port, ["--core", core])
+    try:
+        await wait_for_server(port)
+
+        clients = [BenchClient(f"u{i}", f"room{i // room_size}")
+                   for i in range(connections)]
+
+        start = time.perf_counter()
+        # le premier membre de chaque salon le crée, avant que les autres
+        # essaient de le rejoindre
+        await asyncio.gather(*(c.setup(port, i % room_size == 0)
+                               for i, c in enumerate(clients)))
+        await asyncio.gather(*(c.join() for c in clients))
+        setup_time = time.perf_counter() - start
+
+        expected = {}
+        for c in clients:
+            expected[c.room] = expected.get(c.room, 0) + 1
+        remaining = len(clients)
+        finished = asyncio.get_running_loop().create_future()
+
+        def done():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0 and not finished.done():
+                finished.set_result(None)
+
+        readers = [asyncio.create_task(
+            c.count_messages(expected[c.room] * messages, done))
+            for c in clients]
+
+        start = time.perf_counter()
+        for i in range(messages):
+            for c in clients:
+                c.send({"action": "send_message", "message": f"m{i}"})
+            await asyncio.sleep(0)
+        await asyncio.wait_for(finished, timeout=300)
+        elapsed = time.perf_counter() - start
+
+        delivered = sum(c.received for c in clients)
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*(c.close() for c in clients))
+        return setup_time, delivered, elapsed
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les cœurs du serveur")
+    parser.add_argument("--connections", type=int, nargs="+",
+                        default=[1000, 10000])
+    parser.add_argument("--cores", nargs="+", default=["stream", "protocol"])
+    parser.add_argument("--room-size", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=10,
+                        help="messages envoyés par client")
+    args = parser.parse_args()
+
+    print(f"{'core':<10}{'conns':>8}{'setup s':>10}"
+          f"{'delivered':>12}{'msg/s':>12}")
+    for n in args.connections:
+        for core in args.cores:
+            setup, delivered, elapsed = asyncio.run(
+                run_once(core, n, args.room_size, args.messages)
+            )
+            print(f"{core:<10}{n:>8}{setup:>10.2f}"
+                  f"{delivered:>12}{delivered / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
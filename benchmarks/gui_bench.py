@@ -0,0 +1,89 @@
+# benchmarks/gui_bench.py
+"""Temps d'affichage d'une rafale de messages dans le client graphique.
+
+Compare l'affichage message par message (une insertion et un défilement
+par message) à l'affichage par lot de process_incoming. Demande un
+affichage (DISPLAY) et ttkbootstrap.
+
+Usage : python -m benchmarks.gui_bench [--bursts 100,1000,5000] [-r 3]
+                                        [--virtual-view memory|mmap]
+"""
+import argparse
+import sys
+import time
+
+
+def make_burst(n):
+    return [{"type": "chat_message", "id": i + 1, "room": "general",
+             "from": f"user{i % 50}",
+             "message": f"message {i} de la rafale, un peu de texte"}
+            for i in range(n)]
+
+
+def clear(gui):
+    gui.clear_chat()
+    gui.root.update()
+
+
+def per_message(gui, burst):
+    """Ancien chemin : chaque message est affiché dès qu'il est traité."""
+    start = time.perf_counter()
+    for msg in burst:
+        gui.handle_server_message(msg)
+    gui.root.update()
+    return time.perf_counter() - start
+
+
+def batched(gui, burst):
+    """Toute la rafale dans la file, vidée par un seul cycle."""
+    start = time.perf_counter()
+    for msg in burst:
+        gui.incoming_queue.put(msg)
+    gui.process_incoming()
+    gui.root.update()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bursts", default="100,1000,5000",
+                        help="tailles de rafale, séparées par des virgules")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="mesures par taille (on garde la meilleure)")
+    parser.add_argument("--virtual-view", choices=("memory", "mmap"),
+                        help="mesurer la zone de chat virtualisée")
+    args = parser.parse_args()
+
+    try:
+        from client import ChatClientGUI
+        gui = ChatClientGUI(virtual_view=args.virtual_view)
+    except ImportError as e:
+        print(f"client graphique indisponible : {e}", file=sys.stderr)
+        return 1
+    except Exception as e:  # tkinter.TclError : pas d'affichage
+        print(f"impossible d'ouvrir une fenêtre : {e}", file=sys.stderr)
+        return 1
+    gui.current_room = "general"
+    gui.root.update()
+
+    print(f"{'rafale':>8}{'par message (ms)':>20}{'par lot (ms)':>16}")
+    try:
+        for n in (int(x) for x in args.bursts.split(",")):
+            burst = make_burst(n)
+            results = []
+            for bench in (per_message, batched):
+                best = float("inf")
+                for _ in range(args.repeat):
+                    clear(gui)
+                    best = min(best, bench(gui, burst))
+                    # vider les réveils générés par la file
+                    gui.root.update()
+                results.append(best * 1000)
+            print(f"{n:>8}{results[0]:>20.1f}{results[1]:>16.1f}")
+    finally:
+        gui.on_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+# benchmarks/hotpaths.py
+"""Micro-benchmarks des chemins chauds de ChatServer, sans réseau.
+
+Les connexions utilisent de faux StreamWriter en mémoire : on mesure
+uniquement le code du serveur (décodage + dispatch, fan-out, changement
+de salon, nettoyage d'un client).
+
+    python -m benchmarks.hotpaths              # compare à la référence
+    python -m benchmarks.hotpaths --save       # enregistre la référence
+    python -m benchmarks.hotpaths -k broadcast # seulement certains tests
+
+La référence est un fichier JSON (benchmarks/baselines/hotpaths.json par
+défaut) ; un test plus lent que la référence de plus de --tolerance est
+signalé et la commande sort avec le code 1.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+from server import ChatServer, ClientConnection
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baselines", "hotpaths.json")
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def is_closing(self):
+        return False
+
+    def abort(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeWriter:
+    """Sous-ensemble de StreamWriter utilisé par ClientConnection."""
+
+    def __init__(self, peer):
+        self.transport = FakeTransport()
+        self.peer = peer
+
+    def get_extra_info(self, name, default=None):
+        return self.peer if name == "peername" else default
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def fake_connection(server, i):
+    # pas de start() : la file n'est jamais vidée par une tâche, les tests
+    # la vident eux-mêmes pour ne mesurer que la mise en file
+    return ClientConnection(FakeWriter(("127.0.0.1", 10000 + i)),
+                            framing=server.default_framing)
+
+
+async def add_members(server, room, count):
+    """Inscrit count clients factices et les place dans room."""
+    if room not in server.rooms:
+        server.add_room(room)
+    conns = []
+    for i in range(count):
+        conn = fake_connection(server, i)
+        await server.dispatch({"action": "register",
+                               "username": f"{room}-u{i}"}, conn)
+        await server.dispatch({"action": "join_room", "room": room}, conn)
+        conn.queue.clear()
+        conns.append(conn)
+    return conns
+
+
+# --- les tests : chacun prépare son état et retourne l'opération mesurée ---
+
+async def bench_parse_dispatch():
+    """handle_frame : décodage d'une ligne JSON + dispatch (list_rooms)."""
+    server = ChatServer("127.0.0.1")
+    conn = fake_connection(server, 0)
+    line = b'{"action": "list_rooms"}\n'
+
+    async def op():
+        await server.handle_frame(line, conn)
+        conn.queue.clear()
+    return op
+
+
+async def bench_send_message():
+    """handle_frame d'un send_message dans un salon de 10 membres."""
+    server = ChatServer("127.0.0.1")
+    conns = await add_members(server, "bench", 10)
+    line = b'{"action": "send_message", "message": "hello everyone"}\n'
+    sender = conns[0]
+
+    async def op():
+        await server.handle_frame(line, sender)
+        for conn in conns:
+            conn.queue.clear()
+    return op
+
+
+def make_broadcast_bench(members):
+    async def bench():
+        server = ChatServer("127.0.0.1")
+        conns = await add_members(server, "bench", members)
+        payload = {"type": "chat_message", "room": "bench",
+                   "from": "bench-u0", "message": "hello everyone"}
+
+        async def op():
+            await server.broadcast_room("bench", payload)
+            for conn in conns:
+                conn.queue.clear()
+        return op
+    bench.__doc__ = f"broadcast_room vers {members} membres."
+    return bench
+
+
+async def bench_join_churn():
+    """handle_join_room : un client alterne entre deux salons peuplés."""
+    server = ChatServer("127.0.0.1")
+    await add_members(server, "a", 100)
+    await add_members(server, "b", 100)
+    conn = fake_connection(server, 999)
+    await server.dispatch({"action": "register", "username": "churn"}, conn)
+    join_a = {"action": "join_room", "room": "a"}
+    join_b = {"action": "join_room", "room": "b"}
+
+    async def op():
+        await server.dispatch(join_a, conn)
+        await server.dispatch(join_b, conn)
+        conn.queue.clear()
+    return op
+
+
+async def bench_cleanup_client():
+    """register + cleanup_client d'un client dans un salon de 100 membres."""
+    server = ChatServer("127.0.0.1")
+    await add_members(server, "general", 100)
+    conn = fake_connection(server, 999)
+    register = {"action": "register", "username": "ephemeral"}
+
+    async def op():
+        conn.username = None
+        await server.dispatch(register, conn)
+        await server.cleanup_client("ephemeral")
+        conn.queue.clear()
+    return op
+
+
+BENCHMARKS = {
+    "parse_dispatch": bench_parse_dispatch,
+    "send_message": bench_send_message,
+    "broadcast_10": make_broadcast_bench(10),
+    "broadcast_100": make_broadcast_bench(100),
+    "broadcast_1000": make_broadcast_bench(1000),
+    "join_churn": bench_join_churn,
+    "cleanup_client": bench_cleanup_client,
+}
+
+
+async def measure(factory, min_time, repeat):
+    """Meilleur temps par opération (ns) sur `repeat` séries."""
+    op = await factory()
+
+    # calibrage : assez d'itérations pour durer au moins min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            await op()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            await op()
+        best = min(best, (time.perf_counter_ns() - start) / number)
+    return best
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks du serveur")
+    parser.add_argument("-k", metavar="TEXT",
+                        help="ne lance que les tests dont le nom contient TEXT")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="fichier JSON de référence")
+    parser.add_argument("--save", action="store_true",
+                        help="enregistre les résultats comme référence")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="ralentissement toléré (0.25 = +25 %%)")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="durée minimale d'une série (s)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    # le coût des logs est mesuré par ailleurs ; ici seul le serveur compte
+    logging.getLogger("chat-server").setLevel(logging.WARNING)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<18}{'ns/op':>12}{'baseline':>12}{'ratio':>8}")
+    for name, factory in BENCHMARKS.items():
+        if args.k and args.k not in name:
+            continue
+        ns = asyncio.run(measure(factory, args.min_time, args.repeat))
+        results[name] = {"ns_per_op": round(ns, 1)}
+
+        ref = baseline.get(name, {}).get("ns_per_op")
+        if ref:
+            ratio = ns / ref
+            flag = "  REGRESSION" if ratio > 1 + args.tolerance else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:<18}{ns:>12,.0f}{ref:>12,.0f}{ratio:>8.2f}{flag}")
+        else:
+            print(f"{name:<18}{ns:>12,.0f}{'-':>12}{'-':>8}")
+
+    if args.save:
+        # on garde les références des tests qui n'ont pas été relancés
+        merged = {**baseline, **results}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"environment": environment(), "results": merged},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"regressions: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
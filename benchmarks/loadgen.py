@@ -0,0 +1,260 @@
+# benchmarks/loadgen.py
+"""Générateur de charge pour le serveur de chat (localhost uniquement).
+
+Simule --users utilisateurs qui parlent le même protocole que
+ChatClientAsync (register, join_room, send_message), répartis dans
+--rooms salons. Chaque utilisateur envoie --rate messages/s pendant
+--duration secondes ; l'horodatage d'envoi est dans le texte du message,
+ce qui donne la latence de bout en bout à chaque réception.
+
+Par défaut le serveur est lancé dans un sous-processus (options passées
+après `--`), ce qui permet aussi de mesurer sa mémoire (RSS).
+
+    python -m benchmarks.loadgen --users 2000 --rooms 20 --duration 20
+    python -m benchmarks.loadgen --users 500 -- --core protocol
+    python -m benchmarks.loadgen --port 8888          # serveur déjà lancé
+
+--json écrit les résultats dans un fichier ; --max-p99 (ms) fait
+échouer la commande (code 1) si la latence p99 dépasse le seuil, pour
+s'en servir comme garde-fou contre les régressions.
+"""
+import argparse
+import array
+import asyncio
+import json
+import random
+import sys
+import time
+
+from benchmarks.common import (free_port, percentile, rss_bytes,
+                               start_server, wait_for_server)
+from codec import get_codec
+
+# connexions ouvertes en parallèle pendant la mise en place
+CONNECT_CONCURRENCY = 200
+
+
+class SimUser:
+    def __init__(self, stats, codec, name, room):
+        self.stats = stats
+        self.codec = codec
+        self.name = name
+        self.room = room
+        self.reader = None
+        self.writer = None
+
+    def send(self, payload):
+        self.writer.write(self.codec.dumps(payload) + b"\n")
+
+    async def expect(self, mtype):
+        while True:
+            msg = self.codec.loads(await self.reader.readline())
+            if msg.get("type") == mtype:
+                return msg
+            if msg.get("type") == "error":
+                raise RuntimeError(f"{self.name}: {msg['message']}")
+
+    async def connect(self, host, port, create_room):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.send({"action": "register", "username": self.name})
+        await self.expect("info")
+        if create_room:
+            self.send({"action": "create_room", "room": self.room})
+            # "room_added" (diffusé à tous) puis "info", la réponse
+            await self.expect("info")
+
+    async def join(self):
+        self.send({"action": "join_room", "room": self.room})
+        await self.expect("room_joined")
+
+    async def receive(self):
+        stats = self.stats
+        loads = self.codec.loads
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            msg = loads(line)
+            if msg.get("type") != "chat_message":
+                continue
+            now = time.perf_counter_ns()
+            sent = int(msg["message"].split(" ", 1)[0])
+            stats.received += 1
+            if stats.recording:
+                stats.latencies.append((now - sent) / 1e6)
+
+    async def talk(self, rate, padding):
+        # départs décalés pour ne pas envoyer tous en même temps
+        await asyncio.sleep(random.random() / rate)
+        while True:
+            self.send({
+                "action": "send_message",
+                "message": f"{time.perf_counter_ns()} {padding}",
+            })
+            self.stats.sent += 1
+            # attente exponentielle : arrivées de type Poisson
+            await asyncio.sleep(random.expovariate(rate))
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.recording = False
+        self.latencies = array.array("d")   # millisecondes
+
+
+async def run(args, server_pid=None):
+    stats = Stats()
+    codec = get_codec()
+    # suffixe propre à chaque lancement : contre un serveur déjà lancé, les
+    # salons d'un lancement précédent existent encore (avec leur historique)
+    run_id = f"{random.getrandbits(32):08x}"
+    users = [SimUser(stats, codec, f"load{i}-{run_id}",
+                     f"load-room{i % args.rooms}-{run_id}")
+             for i in range(args.users)]
+
+    # 1) connexion + inscription ; le premier utilisateur de chaque salon
+    #    le crée avant que les autres ne le rejoignent
+    start = time.perf_counter()
+    limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(i, user):
+        async with limit:
+            await user.connect(args.host, args.port, i < args.rooms)
+
+    await asyncio.gather(*(connect(i, u) for i, u in enumerate(users)))
+    await asyncio.gather(*(u.join() for u in users))
+    setup = time.perf_counter() - start
+
+    receivers = [asyncio.create_task(u.receive()) for u in users]
+    padding = "x" * max(0, args.size - 20)
+    talkers = [asyncio.create_task(u.talk(args.rate, padding))
+               for u in users]
+
+    # 2) chauffe, puis mesure
+    await asyncio.sleep(args.warmup)
+    stats.recording = True
+    sent0, received0 = stats.sent, stats.received
+    start = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    sent = stats.sent - sent0
+    elapsed = time.perf_counter() - start
+    for task in talkers:
+        task.cancel()
+    # laisser arriver les derniers messages en vol
+    await asyncio.sleep(args.drain)
+    stats.recording = False
+
+    rss, rss_peak = rss_bytes(server_pid) if server_pid else (None, None)
+
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*(u.close() for u in users))
+
+    latencies = sorted(stats.latencies)
+    return {
+        "users": args.users,
+        "rooms": args.rooms,
+        "rate_per_user": args.rate,
+        "duration_s": round(elapsed, 3),
+        "setup_s": round(setup, 3),
+        "sent_per_s": round(sent / elapsed, 1),
+        "delivered_per_s": round((stats.received - received0) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "p999": round(percentile(latencies, 0.999), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+        "server_rss_bytes": rss,
+        "server_peak_rss_bytes": rss_peak,
+    }
+
+
+def report(result):
+    lat = result["latency_ms"]
+    print(f"users={result['users']} rooms={result['rooms']} "
+          f"rate={result['rate_per_user']}/s/user "
+          f"duration={result['duration_s']}s setup={result['setup_s']}s")
+    print(f"sent      {result['sent_per_s']:>12,.0f} msg/s")
+    print(f"delivered {result['delivered_per_s']:>12,.0f} msg/s")
+    print(f"latency   p50={lat['p50']:.2f} ms  p99={lat['p99']:.2f} ms  "
+          f"p999={lat['p999']:.2f} ms  max={lat['max']:.2f} ms")
+    if result["server_rss_bytes"] is not None:
+        print(f"server    rss={result['server_rss_bytes'] / 2**20:.1f} MiB  "
+              f"peak={result['server_peak_rss_bytes'] / 2**20:.1f} MiB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Générateur de charge pour le serveur de chat",
+        epilog="Les arguments après -- sont passés à server.py.",
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="messages/s envoyés par utilisateur")
+    parser.add_argument("--size", type=int, default=64,
+                        help="taille approximative du texte des messages")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="durée de la mesure (s)")
+    parser.add_argument("--warmup", type=float, default=2.0,
+                        help="durée de chauffe non mesurée (s)")
+    parser.add_argument("--drain", type=float, default=1.0,
+                        help="attente des derniers messages en fin de mesure (s)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help="serveur déjà lancé (sinon on en démarre un)")
+    parser.add_argument("--json", metavar="FILE",
+                        help="écrit les résultats en JSON dans FILE")
+    parser.add_argument("--max-p99", type=float, metavar="MS",
+                        help="échoue si la latence p99 dépasse MS")
+    parser.add_argument("server_args", nargs="*",
+                        help="options de server.py (après --)")
+    args = parser.parse_args(argv)
+    if args.rooms > args.users:
+        parser.error("--rooms must not exceed --users")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    proc = None
+    if args.port is None:
+        args.port = free_port()
+        proc = start_server(args.port, args.server_args)
+
+    async def go():
+        await wait_for_server(args.port)
+        return await run(args, proc.pid if proc else None)
+
+    try:
+        result = asyncio.run(go())
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.max_p99 is not None and result["latency_ms"]["p99"] > args.max_p99:
+        print(f"FAIL: p99 {result['latency_ms']['p99']:.2f} ms > "
+              f"{args.max_p99} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
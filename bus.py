@@ -0,0 +1,199 @@
+# bus.py
+"""Bus local entre les processus workers du serveur (mode --workers N).
+
+Le processus parent fait tourner un BusHub sur une socket Unix ; chaque
+worker s'y connecte avec un BusClient. Le hub est l'arbitre unique des
+pseudos et des noms de salons, et relaie les messages de salon d'un
+worker vers tous les autres : chaque worker livre ensuite à ses propres
+membres. Les messages du bus utilisent le framing "length".
+"""
+import asyncio
+import itertools
+import logging
+
+from codec import CodecError, get_codec
+from framing import DEFAULT_MAX_FRAME, make_framing
+
+logger = logging.getLogger("chat-bus")
+
+
+class BusHub:
+    def __init__(self, path, rooms=("general",)):
+        self.path = path
+        self.framing = make_framing("length", get_codec(), DEFAULT_MAX_FRAME)
+
+        self.writers = set()       # un StreamWriter par worker connecté
+        self.users = {}            # username -> writer du worker qui l'a
+        self.rooms = list(rooms)   # ordre de création conservé
+        self._room_set = set(rooms)
+        self.history = {}          # salon -> taille d'historique demandée
+
+    async def serve(self):
+        server = await asyncio.start_unix_server(self.handle_worker, self.path)
+        logger.info("Bus listening on %s", self.path)
+        async with server:
+            await server.serve_forever()
+
+    def send(self, writer, payload):
+        writer.write(self.framing.pack(payload))
+
+    def forward(self, origin, payload):
+        """Relaie un message à tous les workers sauf celui d'origine."""
+        data = self.framing.pack(payload)
+        for writer in self.writers:
+            if writer is not origin:
+                writer.write(data)
+
+    async def handle_worker(self, reader, writer):
+        self.writers.add(writer)
+        # état courant pour le nouveau worker
+        self.send(writer, {"op": "rooms", "rooms": self.rooms,
+                           "history": self.history})
+        try:
+            while True:
+                data = await self.framing.read(reader)
+                if data is None:
+                    break
+                try:
+                    msg = self.framing.loads(data)
+                except CodecError:
+                    logger.warning("Invalid bus message dropped")
+                    continue
+                self.handle_message(msg, writer)
+        except Exception as e:
+            logger.exception("Bus error: %s", e)
+        finally:
+            self.writers.discard(writer)
+            # les utilisateurs de ce worker sont partis avec lui
+            for user in [u for u, w in self.users.items() if w is writer]:
+                del self.users[user]
+            writer.close()
+
+    def handle_message(self, msg, writer):
+        op = msg.get("op")
+        if op == "broadcast":
+            self.forward(writer, msg)
+        elif op == "claim":
+            ok = msg["user"] not in self.users
+            if ok:
+                self.users[msg["user"]] = writer
+            self.send(writer, {"op": "reply", "id": msg["id"], "ok": ok})
+        elif op == "release":
+            if self.users.get(msg["user"]) is writer:
+                del self.users[msg["user"]]
+        elif op == "create_room":
+            room = msg["room"]
+            ok = room not in self._room_set
+            if ok:
+                self._room_set.add(room)
+                self.rooms.append(room)
+                if msg.get("history") is not None:
+                    self.history[room] = msg["history"]
+                self.forward(writer, {"op": "room_created", "room": room,
+                                      "history": msg.get("history")})
+            self.send(writer, {"op": "reply", "id": msg["id"], "ok": ok})
+        elif op == "delete_room":
+            room = msg["room"]
+            if room in self._room_set:
+                self._room_set.discard(room)
+                self.rooms.remove(room)
+                self.history.pop(room, None)
+                self.forward(writer, {"op": "room_deleted", "room": room})
+        else:
+            logger.warning("Unknown bus op: %s", op)
+
+
+class BusClient:
+    """Côté worker : requêtes au hub et réception des événements relayés.
+
+    `server` doit fournir on_bus_rooms(rooms, history),
+    on_bus_room_created(room, history), on_bus_room_deleted(room) et
+    on_bus_broadcast(room, payload).
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.framing = make_framing("length", get_codec(), DEFAULT_MAX_FRAME)
+        self.reader = None
+        self.writer = None
+        self.closed = None
+        self._ids = itertools.count()
+        self._pending = {}         # id de requête -> future
+
+    async def connect(self, path, timeout=10.0):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(path)
+                break
+            except OSError:
+                # le hub démarre en même temps que les workers
+                if loop.time() > deadline:
+                    raise
+                await asyncio.sleep(0.05)
+        self.closed = loop.create_future()
+        asyncio.create_task(self._read_loop())
+
+    def send(self, payload):
+        self.writer.write(self.framing.pack(payload))
+
+    async def request(self, payload):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self.send({**payload, "id": request_id})
+        return await future
+
+    async def claim_user(self, username):
+        """True si le pseudo était libre sur l'ensemble des workers."""
+        reply = await self.request({"op": "claim", "user": username})
+        return reply["ok"]
+
+    def release_user(self, username):
+        self.send({"op": "release", "user": username})
+
+    async def create_room(self, room, history=None):
+        """True si le salon n'existait encore sur aucun worker."""
+        reply = await self.request({"op": "create_room", "room": room,
+                                    "history": history})
+        return reply["ok"]
+
+    def delete_room(self, room):
+        self.send({"op": "delete_room", "room": room})
+
+    def publish(self, room, payload):
+        self.send({"op": "broadcast", "room": room, "payload": payload})
+
+    async def _read_loop(self):
+        try:
+            while True:
+                data = await self.framing.read(self.reader)
+                if data is None:
+                    break
+                msg = self.framing.loads(data)
+                op = msg.get("op")
+                if op == "reply":
+                    future = self._pending.pop(msg["id"], None)
+                    if future and not future.done():
+                        future.set_result(msg)
+                elif op == "broadcast":
+                    await self.server.on_bus_broadcast(msg["room"],
+                                                       msg["payload"])
+                elif op == "room_created":
+                    self.server.on_bus_room_created(msg["room"],
+                                                    msg.get("history"))
+                elif op == "room_deleted":
+                    await self.server.on_bus_room_deleted(msg["room"])
+                elif op == "rooms":
+                    self.server.on_bus_rooms(msg["rooms"],
+                                             msg.get("history", {}))
+        except Exception as e:
+            logger.exception("Bus error: %s", e)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("bus closed"))
+            self._pending.clear()
+            if not self.closed.done():
+                self.closed.set_result(None)
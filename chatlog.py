@@ -0,0 +1,144 @@
+# chatlog.py
+"""Configuration des logs du serveur.
+
+Par défaut les handlers n'écrivent pas depuis la boucle asyncio : les
+enregistrements passent par une file et un thread (QueueListener) les
+formate et les écrit sur stderr. Le thread de la boucle ne fait plus
+qu'un put() dans la file.
+
+Trois formats de sortie : "text" (lisible), "kv" (clé=valeur) et "json"
+(une ligne JSON par enregistrement). Les deux derniers reprennent les
+champs passés dans `extra=` par le code, sans avoir à analyser le texte.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+LOG_FORMAT = '[%(asctime)s] %(levelname)s:%(name)s: %(message)s'
+
+# attributs présents sur tout LogRecord : le reste vient de `extra`
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {
+    "message", "asctime", "taskName",
+}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Base des formats "kv" et "json" : un dict de champs par enregistrement."""
+
+    def fields(self, record):
+        fields = {
+            "ts": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                fields[key] = value
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        return fields
+
+
+class KeyValueFormatter(StructuredFormatter):
+    def format(self, record):
+        return " ".join(f"{key}={_kv_value(value)}"
+                        for key, value in self.fields(record).items())
+
+
+class JsonFormatter(StructuredFormatter):
+    def format(self, record):
+        return json.dumps(self.fields(record), ensure_ascii=False, default=str)
+
+
+def _kv_value(value):
+    if isinstance(value, str) and value and not any(
+            c in value for c in ' "=\n\\'):
+        return value
+    # guillemets et échappements JSON pour le reste (nombres, tuples...)
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+FORMATTERS = {
+    "text": lambda: logging.Formatter(LOG_FORMAT),
+    "kv": KeyValueFormatter,
+    "json": JsonFormatter,
+}
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui laisse tout le formatage au thread d'écriture.
+
+    QueueHandler.prepare() formate le message dans le thread appelant ;
+    ici on transmet l'enregistrement tel quel (ses arguments sont des
+    valeurs simples qui ne changent plus après l'appel au logger).
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, use_queue=True, stream=None,
+                  fmt="text"):
+    """Installe le handler racine ; retourne le QueueListener éventuel."""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(FORMATTERS[fmt]())
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.setLevel(level)
+
+    if not use_queue:
+        root.addHandler(handler)
+        return None
+
+    records = queue.SimpleQueue()
+    root.addHandler(DeferredQueueHandler(records))
+    listener = logging.handlers.QueueListener(
+        records, handler, respect_handler_level=True
+    )
+    listener.start()
+    # vider la file à la sortie du processus
+    atexit.register(listener.stop)
+    return listener
+
+
+class RateLimiter:
+    """Seau à jetons : au plus `rate` événements par seconde (rafale `burst`).
+
+    Sert à limiter les logs par message ; `suppressed` compte ce qui a été
+    écarté depuis le dernier événement accepté, pour pouvoir le signaler.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.suppressed = 0
+
+    def allow(self):
+        if self.rate <= 0:
+            self.suppressed += 1
+            return False
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1.0:
+            self.suppressed += 1
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def take_suppressed(self):
+        """Nombre d'événements écartés depuis le dernier appel (remis à 0)."""
+        count, self.suppressed = self.suppressed, 0
+        return count
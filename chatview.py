@@ -0,0 +1,237 @@
+# chatview.py
+"""Zone de chat virtualisée pour le client graphique.
+
+Les messages sont gardés dans un MessageStore (en mémoire) ou un
+MmapMessageStore (fichier temporaire lu par mmap : seuls les offsets
+restent en mémoire). VirtualChatView n'affiche dans son widget Text que
+les lignes visibles : le coût d'un défilement ou d'un nouveau message ne
+dépend pas du nombre de messages gardés.
+
+Un store est une séquence de lignes (str, terminées par "\\n") qu'on peut
+compléter à la fin (append) ou au début (prepend, messages plus anciens).
+"""
+import array
+import mmap
+import tempfile
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+# lignes déplacées par un cran de molette
+WHEEL_LINES = 3
+
+
+class MessageStore:
+    """Lignes en mémoire.
+
+    Deux listes : les lignes ajoutées au début (de la plus récente à la
+    plus ancienne) et celles ajoutées à la fin, pour des ajouts en O(1)
+    des deux côtés et un accès direct par position.
+    """
+
+    def __init__(self):
+        self._front = []
+        self._back = []
+
+    def __len__(self):
+        return len(self._front) + len(self._back)
+
+    def __getitem__(self, index):
+        n = len(self._front)
+        if index < n:
+            return self._front[n - 1 - index]
+        return self._back[index - n]
+
+    def lines(self, start, stop):
+        return [self[i] for i in range(max(start, 0), min(stop, len(self)))]
+
+    def extend(self, lines):
+        self._back.extend(lines)
+
+    def prepend(self, lines):
+        """Ajoute au début des lignes plus anciennes (données dans l'ordre)."""
+        self._front.extend(reversed(lines))
+
+    def clear(self):
+        self._front.clear()
+        self._back.clear()
+
+    def close(self):
+        self.clear()
+
+
+class MmapMessageStore(MessageStore):
+    """Lignes écrites dans un fichier temporaire, relues par mmap.
+
+    En mémoire, seulement l'offset et la taille de chaque ligne (12
+    octets) : 100 000 messages tiennent dans environ 1 Mio.
+    """
+
+    def __init__(self, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory or None)
+        self.size = 0
+        self._map = None
+        self._front = (array.array("Q"), array.array("I"))
+        self._back = (array.array("Q"), array.array("I"))
+
+    def __len__(self):
+        return len(self._front[0]) + len(self._back[0])
+
+    def __getitem__(self, index):
+        n = len(self._front[0])
+        if index < n:
+            offsets, sizes = self._front
+            index = n - 1 - index
+        else:
+            offsets, sizes = self._back
+            index -= n
+        if self._map is None or len(self._map) < self.size:
+            # le fichier a grandi depuis la dernière projection
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = offsets[index]
+        return self._map[start:start + sizes[index]].decode()
+
+    def _write(self, lines, index):
+        offsets, sizes = index
+        chunks = []
+        for line in lines:
+            data = line.encode()
+            offsets.append(self.size)
+            sizes.append(len(data))
+            chunks.append(data)
+            self.size += len(data)
+        self.file.seek(0, 2)
+        self.file.write(b"".join(chunks))
+        self.file.flush()
+
+    def extend(self, lines):
+        self._write(lines, self._back)
+
+    def prepend(self, lines):
+        self._write(reversed(lines), self._front)
+
+    def clear(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.file.truncate(0)
+        self.size = 0
+        for offsets, sizes in (self._front, self._back):
+            del offsets[:]
+            del sizes[:]
+
+    def close(self):
+        self.clear()
+        self.file.close()
+
+
+class VirtualChatView(ttk.Frame):
+    """Zone de chat qui n'affiche que les lignes visibles du store.
+
+    `top` est la position de la première ligne affichée. Tant que la vue
+    est en bas, elle suit les nouveaux messages ; sinon elle reste sur
+    place. on_top est appelée quand on arrive en haut (messages plus
+    anciens à charger).
+    """
+
+    def __init__(self, master, store=None, on_top=None, **text_options):
+        super().__init__(master)
+        self.store = store if store is not None else MessageStore()
+        self.on_top = on_top
+        self.top = 0
+        self.follow = True
+
+        self.text = tk.Text(self, state="disabled", **text_options)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical",
+                                       command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.text.pack(side="left", fill="both", expand=True)
+        self.rows = int(self.text.cget("height"))
+        self._linespace = tkfont.Font(font=self.text.cget("font")).metrics(
+            "linespace")
+
+        self.text.bind("<Configure>", self.on_resize)
+        self.text.bind("<MouseWheel>", self.on_wheel)
+        self.text.bind("<Button-4>", lambda e: self.scroll(-WHEEL_LINES))
+        self.text.bind("<Button-5>", lambda e: self.scroll(WHEEL_LINES))
+
+    # --- contenu ---
+
+    def append(self, lines):
+        self.store.extend(lines)
+        if self.follow:
+            self.top = self.bottom_top()
+        self.render()
+
+    def prepend(self, lines):
+        """Ajoute des lignes plus anciennes sans bouger ce qui est affiché."""
+        self.store.prepend(lines)
+        self.top += len(lines)
+        self.render()
+
+    def clear(self):
+        self.store.clear()
+        self.top = 0
+        self.follow = True
+        self.render()
+
+    def close(self):
+        self.store.close()
+
+    # --- défilement ---
+
+    def bottom_top(self):
+        return max(0, len(self.store) - self.rows)
+
+    def scroll(self, lines):
+        self.set_top(self.top + lines)
+        return "break"
+
+    def set_top(self, top):
+        last = self.bottom_top()
+        self.top = min(max(int(top), 0), last)
+        self.follow = self.top >= last
+        self.render()
+        if self.top == 0 and self.on_top is not None:
+            self.on_top()
+
+    def yview(self, *args):
+        """Commande de la barre de défilement (moveto / scroll)."""
+        if args[0] == "moveto":
+            self.set_top(float(args[1]) * len(self.store))
+        elif args[0] == "scroll":
+            step = self.rows if args[2] == "pages" else 1
+            self.set_top(self.top + int(args[1]) * step)
+
+    def on_wheel(self, event):
+        # Windows : multiples de 120 ; macOS : petits entiers
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll(-delta * WHEEL_LINES)
+
+    def on_resize(self, event):
+        rows = max(1, event.height // self._linespace)
+        if rows != self.rows:
+            self.rows = rows
+            if self.follow:
+                self.top = self.bottom_top()
+            self.render()
+
+    def render(self):
+        total = len(self.store)
+        self.top = min(self.top, self.bottom_top())
+        text = "".join(self.store.lines(self.top, self.top + self.rows))
+        self.text.config(state="normal")
+        self.text.delete("1.0", tk.END)
+        # pas de ligne vide sous le dernier message
+        self.text.insert(tk.END, text[:-1] if text.endswith("\n") else text)
+        self.text.config(state="disabled")
+        # des lignes repliées (wrap) peuvent dépasser la hauteur : en bas,
+        # c'est le dernier message qui doit rester visible
+        self.text.see(tk.END if self.follow else "1.0")
+        if total:
+            self.scrollbar.set(self.top / total,
+                               min(self.top + self.rows, total) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
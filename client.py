@@ -1,6 +1,7 @@
 # client.py
+import argparse
 import asyncio
-import json
+import tempfile
 import threading
 import queue
 import tkinter as tk
@@ -9,30 +10,56 @@ from tkinter import scrolledtext, messagebox
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 
+from chatview import MessageStore, MmapMessageStore, VirtualChatView
+from codec import CodecError, get_codec
+from framing import make_framing
+
+# nombre de messages demandés à chaque remontée dans l'historique
+HISTORY_PAGE_SIZE = 50
+
 
 # ==========================
 # Client réseau asynchrone
 # ==========================
 
 class ChatClientAsync:
-    def __init__(self, incoming_queue: queue.Queue, ui_callback_on_disconnect):
+    def __init__(self, incoming_queue: queue.Queue, ui_callback_on_disconnect,
+                 codec=None):
         self.reader = None
         self.writer = None
         self.username = None
         self.connected = False
         self.incoming_queue = incoming_queue
         self.on_disconnect = ui_callback_on_disconnect
+        self.codec = codec or get_codec()
+        # NDJSON jusqu'à ce que le serveur accepte un autre framing
+        self.framing = make_framing("line", self.codec)
 
-    async def connect(self, host, port, username):
+    async def connect(self, host, port, username, framing="line",
+                      encoding="json"):
         self.reader, self.writer = await asyncio.open_connection(host, port)
         self.username = username
         self.connected = True
-
-        # s'enregistrer sur le serveur
-        await self.send_json({
-            "action": "register",
-            "username": username
-        })
+        self.framing = make_framing("line", self.codec)
+
+        # s'enregistrer sur le serveur (en demandant éventuellement un
+        # autre framing, ex. "length" + "msgpack" pour les gros messages)
+        register = {"action": "register", "username": username}
+        if framing != "line" or encoding != "json":
+            register["framing"] = framing
+            register["encoding"] = encoding
+        await self.send_json(register)
+
+        # la réponse arrive encore en NDJSON : on la lit avant de lancer la
+        # boucle de lecture pour savoir quel framing utiliser ensuite
+        data = await self.framing.read(self.reader)
+        if data is None:
+            raise ConnectionError("connection closed during register")
+        reply = self.framing.loads(data)
+        if reply.get("type") == "info" and reply.get("framing", "line") != "line":
+            codec = self.codec if encoding == "json" else get_codec(encoding)
+            self.framing = make_framing(reply["framing"], codec)
+        self.incoming_queue.put(reply)
 
         # démarrer la tâche de lecture
         asyncio.create_task(self.read_loop())
@@ -43,12 +70,12 @@ class ChatClientAsync:
     async def read_loop(self):
         try:
             while self.connected:
-                data = await self.reader.readline()
-                if not data:
+                data = await self.framing.read(self.reader)
+                if data is None:
                     break
                 try:
-                    msg = json.loads(data.decode().strip())
-                except json.JSONDecodeError:
+                    msg = self.framing.loads(data)
+                except CodecError:
                     continue
                 # pousser vers la file pour la GUI (thread-safe)
                 self.incoming_queue.put(msg)
@@ -65,10 +92,24 @@ class ChatClientAsync:
     async def send_json(self, payload):
         if not self.writer:
             return
-        data = (json.dumps(payload) + "\n").encode()
+        data = self.framing.pack(payload)
         self.writer.write(data)
         await self.writer.drain()
 
+    async def fetch_history(self, room=None, before=None,
+                            limit=HISTORY_PAGE_SIZE):
+        """Demande les messages d'id < before (réponse "history").
+
+        Sans room, le salon courant ; sans before, les plus récents. La
+        réponse porte "before", le curseur de la page suivante, et "more".
+        """
+        request = {"action": "fetch_history", "limit": limit}
+        if room:
+            request["room"] = room
+        if before is not None:
+            request["before"] = before
+        await self.send_json(request)
+
     async def disconnect(self):
         self.connected = False
         if self.writer:
@@ -82,13 +123,107 @@ class ChatClientAsync:
 # Interface graphique Tk/ttkbootstrap
 # ==========================
 
+# événement virtuel envoyé au thread Tk quand des messages arrivent
+INCOMING_EVENT = "<<IncomingMessages>>"
+
+# nombre max de lignes de messages gardées dans la zone de chat (0 : pas
+# de limite) ; les plus anciennes sont supprimées par paquets d'un dixième
+DEFAULT_MAX_LINES = 5000
+
+
+class WakeupQueue(queue.Queue):
+    """File qui réveille le thread Tk quand des messages arrivent.
+
+    Un seul réveil par rafale : tant que le thread Tk n'a pas vidé la file
+    (drain), les put() suivants ne le réveillent pas à nouveau.
+    """
+
+    def __init__(self, wakeup):
+        super().__init__()
+        self.wakeup = wakeup
+        self._signalled = False
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        with self.mutex:
+            notify, self._signalled = not self._signalled, True
+        # hors du verrou : l'appel peut attendre le thread Tk, qui peut
+        # lui-même attendre le verrou dans drain()
+        if notify:
+            self.wakeup()
+
+    def drain(self):
+        """Retire et retourne tous les messages en attente."""
+        with self.mutex:
+            # remis à zéro avant de vider : un put() qui suit réveillera
+            self._signalled = False
+            items = list(self.queue)
+            self.queue.clear()
+        return items
+
+
+class SpillCache:
+    """Lignes retirées de la zone de chat, gardées dans un fichier temporaire.
+
+    Pile de paquets : le dernier paquet retiré est le plus proche du haut
+    de la zone, c'est donc le premier rechargé quand on remonte.
+    """
+
+    def __init__(self, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory or None)
+        self.chunks = []           # (offset, taille) de chaque paquet
+        self.size = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def push(self, text):
+        data = text.encode()
+        self.file.seek(self.size)
+        self.file.write(data)
+        self.chunks.append((self.size, len(data)))
+        self.size += len(data)
+
+    def pop(self):
+        """Retire et retourne le dernier paquet, ou None."""
+        if not self.chunks:
+            return None
+        offset, size = self.chunks.pop()
+        self.file.seek(offset)
+        data = self.file.read(size)
+        self.file.truncate(offset)
+        self.size = offset
+        return data.decode()
+
+    def clear(self):
+        self.chunks.clear()
+        self.file.truncate(0)
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
 class ChatClientGUI:
-    def __init__(self):
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, spill_dir=None,
+                 virtual_view=None):
+        """max_lines : lignes gardées dans la zone de chat (0 : sans limite).
+
+        spill_dir : si donné ("" pour le dossier temporaire par défaut), les
+        lignes retirées sont gardées sur disque et rechargées quand on
+        remonte ; sinon elles sont perdues.
+
+        virtual_view : "memory" ou "mmap" pour la zone de chat virtualisée
+        (voir chatview.py) ; toutes les lignes sont alors gardées dans son
+        store et max_lines / spill_dir sont ignorés.
+        """
         self.root = tb.Window(themename="cosmo")
         self.root.title("Client Chat - ttkbootstrap")
 
-        # file de messages provenant du thread asyncio
-        self.incoming_queue = queue.Queue()
+        # file de messages provenant du thread asyncio ; chaque rafale
+        # réveille le thread Tk par un événement virtuel (pas de polling)
+        self.incoming_queue = WakeupQueue(self.notify_incoming)
+        self.root.bind(INCOMING_EVENT, self.process_incoming)
 
         # boucle asyncio dans un thread séparé
         self.loop = asyncio.new_event_loop()
@@ -103,12 +238,26 @@ class ChatClientGUI:
         )
 
         self.current_room = None
+        # salons affichés dans list_rooms, dans le même ordre
+        self.room_names = []
+        self._room_set = set()
+        # remontée dans l'historique du salon courant
+        self.oldest_id = None          # plus ancien message affiché
+        self.history_more = False      # le serveur en a de plus anciens
+        self.history_pending = False   # une page est déjà demandée
+        # texte à afficher en fin de cycle de process_incoming (None hors
+        # d'un cycle : affichage immédiat)
+        self._chat_batch = None
+        # historique borné de la zone de chat
+        self.max_lines = max_lines
+        self.trim_chunk = max(1, max_lines // 10)
+        self.spill = SpillCache(spill_dir) if spill_dir is not None else None
+        if virtual_view:
+            self.max_lines, self.spill = 0, None
+        self.virtual_view = virtual_view
 
         self.build_ui()
 
-        # timer pour traiter la file
-        self.root.after(100, self.process_incoming)
-
     # --- Gestion de la boucle asyncio dans un thread séparé ---
 
     def run_loop(self):
@@ -195,10 +344,27 @@ class ChatClientGUI:
         frame_chat = tb.Labelframe(frame_main, text="Chat")
         frame_chat.pack(side=LEFT, fill=BOTH, expand=True)
 
-        self.text_chat = scrolledtext.ScrolledText(
-            frame_chat, state="disabled", wrap="word", height=15
-        )
-        self.text_chat.pack(fill=BOTH, expand=True, padx=5, pady=5)
+        if self.virtual_view:
+            # seules les lignes visibles sont dans le widget Text
+            store = (MmapMessageStore() if self.virtual_view == "mmap"
+                     else MessageStore())
+            self.chat_view = VirtualChatView(
+                frame_chat, store, on_top=self.load_older,
+                wrap="word", height=15
+            )
+            self.chat_view.pack(fill=BOTH, expand=True, padx=5, pady=5)
+            self.text_chat = None
+        else:
+            self.chat_view = None
+            self.text_chat = scrolledtext.ScrolledText(
+                frame_chat, state="disabled", wrap="word", height=15
+            )
+            self.text_chat.pack(fill=BOTH, expand=True, padx=5, pady=5)
+            # arrivé en haut de la zone, on charge les messages plus anciens,
+            # insérés au niveau de la marque "history" (voir room_joined)
+            self.text_chat.config(yscrollcommand=self.on_chat_scroll)
+            self.text_chat.mark_set("history", "1.0")
+            self.text_chat.mark_gravity("history", "left")
 
         frame_input = tb.Frame(frame_chat)
         frame_input.pack(fill=X, padx=5, pady=(0, 5))
@@ -313,19 +479,36 @@ class ChatClientGUI:
 
     # --- Gestion des messages entrants ---
 
-    def process_incoming(self):
-        """Appelée régulièrement par Tk pour traiter la file."""
-        while True:
-            try:
-                msg = self.incoming_queue.get_nowait()
-            except queue.Empty:
-                break
-            self.handle_server_message(msg)
+    def notify_incoming(self):
+        """Appelée depuis le thread asyncio : réveille le thread Tk."""
+        try:
+            self.root.event_generate(INCOMING_EVENT, when="tail")
+        except (tk.TclError, RuntimeError):
+            # fenêtre fermée ou boucle Tk arrêtée
+            pass
 
-        # rappeler cette fonction après 100ms
-        self.root.after(100, self.process_incoming)
+    def process_incoming(self, event=None):
+        """Traite tous les messages arrivés depuis le dernier réveil.
+
+        Le texte produit par toute la rafale est affiché en une fois à la
+        fin : une insertion, un changement d'état et un défilement.
+        """
+        self._chat_batch = []
+        try:
+            for msg in self.incoming_queue.drain():
+                self.handle_server_message(msg)
+        finally:
+            batch, self._chat_batch = self._chat_batch, None
+            self.insert_chat(batch)
 
     def clear_chat(self):
+        if self._chat_batch:
+            self._chat_batch.clear()
+        if self.spill is not None:
+            self.spill.clear()
+        if self.chat_view is not None:
+            self.chat_view.clear()
+            return
         self.text_chat.config(state="normal")
         self.text_chat.delete("1.0", tk.END)
         self.text_chat.config(state="disabled")
@@ -336,8 +519,11 @@ class ChatClientGUI:
             self.append_chat(f"[INFO] {msg.get('message')}\n")
             room = msg.get("room")
             if room:
+                # réponse à "register" : placé d'office dans ce salon, dont
+                # l'historique récent suit
                 self.current_room = room
                 self.append_chat(f"Salon actuel : {room}\n")
+                self.start_history()
 
         elif mtype == "error":
             self.append_chat(f"[ERREUR] {msg.get('message')}\n")
@@ -345,40 +531,180 @@ class ChatClientGUI:
         elif mtype == "room_list":
             self.update_room_list(msg.get("rooms", []))
 
+        elif mtype == "room_added":
+            self.add_room_entry(msg.get("room"))
+
+        elif mtype == "room_removed":
+            self.remove_room_entry(msg.get("room"))
+
         elif mtype == "room_joined":
             room = msg.get("room")
             self.current_room = room
             # effacer la conversation précédente quand on change de salon
             self.clear_chat()
             self.append_chat(f"Vous avez rejoint le salon : {room}\n")
+            self.start_history()
 
         elif mtype == "room_left":
             room = msg.get("room")
             self.clear_chat()
             self.append_chat(f"Vous avez quitté le salon : {room}\n")
             self.current_room = None
+            self.history_more = False
 
         elif mtype == "chat_message":
             room = msg.get("room")
             sender = msg.get("from")
             text = msg.get("message")
+            if room == self.current_room and self.oldest_id is None:
+                self.oldest_id = msg.get("id")
             self.append_chat(f"[{room}] {sender}: {text}\n")
 
+        elif mtype == "history":
+            self.prepend_history(msg)
+
         elif mtype == "disconnected":
             # géré par on_disconnected
-            pass
+            self.history_more = False
+
+    def start_history(self):
+        """Prépare le chargement des pages plus anciennes du salon courant."""
+        self.flush_chat()
+        # les pages plus anciennes s'insèrent ici, sous l'en-tête
+        if self.chat_view is None:
+            self.text_chat.mark_set("history", "end-1c")
+        self.oldest_id = None
+        self.history_more = True
+        self.history_pending = False
 
     def update_room_list(self, rooms):
-        self.list_rooms.delete(0, tk.END)
-        for r in rooms:
-            self.list_rooms.insert(tk.END, r)
+        """Applique une liste complète en ne touchant qu'aux différences."""
+        wanted = set(rooms)
+        # du bas vers le haut : les indices restant à voir ne bougent pas
+        for i in range(len(self.room_names) - 1, -1, -1):
+            if self.room_names[i] not in wanted:
+                self._room_set.discard(self.room_names[i])
+                del self.room_names[i]
+                self.list_rooms.delete(i)
+        for room in rooms:
+            self.add_room_entry(room)
+
+    def add_room_entry(self, room):
+        if not room or room in self._room_set:
+            return
+        self._room_set.add(room)
+        self.room_names.append(room)
+        self.list_rooms.insert(tk.END, room)
+
+    def remove_room_entry(self, room):
+        if room not in self._room_set:
+            return
+        self._room_set.discard(room)
+        i = self.room_names.index(room)
+        del self.room_names[i]
+        self.list_rooms.delete(i)
+
+    def on_chat_scroll(self, first, last):
+        self.text_chat.vbar.set(first, last)
+        if float(first) <= 0.0:
+            self.load_older()
+
+    def load_older(self):
+        """Recharge d'abord les lignes gardées sur disque, puis le serveur."""
+        text = self.spill.pop() if self.spill else None
+        if text:
+            self.prepend_chat(text)
+        else:
+            self.request_older()
+
+    def request_older(self):
+        """Demande la page précédente du salon courant, une à la fois."""
+        # sans message affiché, rien à compléter (et le rejeu à l'arrivée
+        # dans le salon n'est peut-être pas encore traité)
+        if (not self.client.connected or self.oldest_id is None
+                or not self.history_more or self.history_pending):
+            return
+        self.history_pending = True
+        self.run_coro(self.client.fetch_history(self.current_room,
+                                                before=self.oldest_id))
+
+    def prepend_history(self, msg):
+        room = msg.get("room")
+        if room != self.current_room:
+            return
+        self.history_pending = False
+        self.history_more = bool(msg.get("more"))
+        messages = msg.get("messages", [])
+        if msg.get("before") is not None:
+            self.oldest_id = msg["before"]
+        if not messages:
+            return
+        self.prepend_chat("".join(
+            f"[{room}] {m.get('from')}: {m.get('message')}\n"
+            for m in messages))
+
+    def prepend_chat(self, text):
+        """Insère des lignes plus anciennes sous l'en-tête du salon."""
+        self.flush_chat()
+        if self.chat_view is not None:
+            # vue virtualisée : au début du store, au-dessus de l'en-tête
+            self.chat_view.prepend(text.splitlines(keepends=True))
+            return
+        # garder à l'écran les mêmes lignes qu'avant l'insertion
+        top = int(self.text_chat.index("@0,0").split(".")[0])
+        self.text_chat.config(state="normal")
+        self.text_chat.insert("history", text)
+        self.text_chat.config(state="disabled")
+        lines = text.count("\n")
+        self.text_chat.yview(f"{top + lines}.0")
 
     def append_chat(self, text):
+        if self._chat_batch is not None:
+            self._chat_batch.append(text)
+        else:
+            self.insert_chat([text])
+
+    def flush_chat(self):
+        """Affiche tout de suite le texte en attente du cycle en cours."""
+        if self._chat_batch:
+            self.insert_chat(self._chat_batch)
+            self._chat_batch.clear()
+
+    def insert_chat(self, chunks):
+        if not chunks:
+            return
+        if self.chat_view is not None:
+            # une entrée du store par ligne affichée
+            self.chat_view.append("".join(chunks).splitlines(keepends=True))
+            return
         self.text_chat.config(state="normal")
-        self.text_chat.insert(tk.END, text)
+        self.text_chat.insert(tk.END, "".join(chunks))
+        self.trim_chat()
         self.text_chat.see(tk.END)
         self.text_chat.config(state="disabled")
 
+    def trim_chat(self):
+        """Supprime les lignes les plus anciennes au-delà de max_lines.
+
+        Seulement quand l'excédent atteint un paquet (trim_chunk) : une
+        suppression pour plusieurs centaines de lignes, pas une par message.
+        """
+        if not self.max_lines:
+            return
+        start = int(self.text_chat.index("history").split(".")[0])
+        end = int(self.text_chat.index("end-1c").split(".")[0])
+        excess = end - start - self.max_lines
+        if excess < self.trim_chunk:
+            return
+        cut = f"{start + excess}.0"
+        if self.spill is not None:
+            self.spill.push(self.text_chat.get("history", cut))
+        else:
+            # ces messages ne pourront plus être redemandés au serveur
+            # sans laisser de trou
+            self.history_more = False
+        self.text_chat.delete("history", cut)
+
     # --- Boucle principale ---
 
     def run(self):
@@ -387,6 +713,10 @@ class ChatClientGUI:
 
     def on_close(self):
         # arrêter proprement
+        if self.spill is not None:
+            self.spill.close()
+        if self.chat_view is not None:
+            self.chat_view.close()
         if self.client.connected:
             self.run_coro(self.client.disconnect())
         # arrêter la boucle asyncio
@@ -395,5 +725,21 @@ class ChatClientGUI:
 
 
 if __name__ == "__main__":
-    app = ChatClientGUI()
+    parser = argparse.ArgumentParser(description="Client de chat")
+    parser.add_argument("--max-lines", type=int, default=DEFAULT_MAX_LINES,
+                        help="lignes gardées dans la zone de chat "
+                             "(0 : sans limite)")
+    parser.add_argument("--spill-cache", nargs="?", const="", default=None,
+                        metavar="DIR",
+                        help="garder sur disque (dans DIR, ou le dossier "
+                             "temporaire) les lignes retirées, rechargées "
+                             "en remontant")
+    parser.add_argument("--virtual-view", nargs="?", const="memory",
+                        choices=("memory", "mmap"), default=None,
+                        help="zone de chat virtualisée : seules les lignes "
+                             "visibles sont affichées ; messages gardés en "
+                             "mémoire ou dans un fichier lu par mmap")
+    args = parser.parse_args()
+    app = ChatClientGUI(max_lines=args.max_lines, spill_dir=args.spill_cache,
+                        virtual_view=args.virtual_view)
     app.run()
\ No newline at end of file
@@ -0,0 +1,145 @@
+# codec.py
+"""Encodage des messages du protocole (un objet JSON par message).
+
+Le module json de la bibliothèque standard sert de référence ; si orjson
+ou msgspec sont installés, get_codec() les préfère automatiquement.
+MessagePack (msgpack) est proposé en plus pour le framing binaire.
+L'interface ne manipule que des bytes : orjson et msgspec lisent et
+écrivent sans aucune chaîne intermédiaire.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # dépendance optionnelle
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:  # dépendance optionnelle
+    msgpack = None
+
+
+class CodecError(ValueError):
+    """Message reçu impossible à décoder."""
+
+
+class JsonCodec:
+    """Codec de référence, toujours disponible."""
+
+    name = "json"
+    binary = False
+
+    def __init__(self):
+        # instances réutilisées : json.dumps(..., separators=...) en
+        # recréerait une à chaque appel
+        self._encoder = json.JSONEncoder(separators=(",", ":"))
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj).encode()
+
+    def loads(self, data):
+        # decode() ignore déjà les blancs autour, dont le "\n" final
+        try:
+            return self._decoder.decode(data.decode())
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise CodecError(str(e)) from e
+
+
+class OrjsonCodec:
+    name = "orjson"
+    binary = False
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as e:
+            raise CodecError(str(e)) from e
+
+
+class MsgspecCodec:
+    name = "msgspec"
+    binary = False
+
+    def __init__(self):
+        if msgspec is None:
+            raise ImportError("msgspec is not installed")
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def loads(self, data):
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise CodecError(str(e)) from e
+
+
+class MsgpackCodec:
+    """MessagePack : plus compact, mais ses octets peuvent contenir "\n"."""
+
+    name = "msgpack"
+    binary = True   # utilisable seulement avec un framing par longueur
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("msgpack is not installed")
+
+    def dumps(self, obj):
+        return msgpack.packb(obj)
+
+    def loads(self, data):
+        try:
+            return msgpack.unpackb(data)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise CodecError(str(e)) from e
+
+
+# codecs JSON, par ordre de préférence pour "auto"
+CODECS = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "json": JsonCodec,
+}
+
+# codecs binaires, jamais choisis par "auto"
+BINARY_CODECS = {
+    "msgpack": MsgpackCodec,
+}
+
+
+def available_codecs():
+    """Noms des codecs utilisables dans cet environnement."""
+    names = []
+    for name, cls in CODECS.items():
+        try:
+            cls()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_codec(name="auto"):
+    """Retourne une instance de codec ; "auto" prend le plus rapide installé."""
+    if name == "auto":
+        return CODECS[available_codecs()[0]]()
+    cls = CODECS.get(name) or BINARY_CODECS.get(name)
+    if cls is None:
+        raise ValueError(f"unknown codec: {name}")
+    return cls()
@@ -0,0 +1,124 @@
+# framing.py
+"""Découpage du flux TCP en messages.
+
+- "line"   : NDJSON, un message JSON par ligne (mode par défaut) ;
+- "length" : chaque message est précédé de sa taille sur 4 octets
+             (big-endian). Pas de recherche de "\n", pas de limite de
+             64 Kio, et le contenu peut être binaire (MessagePack).
+
+Le mode est négocié par le client dans l'action "register".
+"""
+import asyncio
+import struct
+
+# taille maximale d'un message en mode "length"
+DEFAULT_MAX_FRAME = 16 * 1024 * 1024
+
+# limite par défaut de StreamReader.readline() côté pair, en mode "line"
+LINE_LIMIT = 64 * 1024
+
+
+class FrameTooLarge(ValueError):
+    """Message plus grand que ce que le framing accepte."""
+
+
+class LineFraming:
+    """Un message par ligne, terminé par "\\n"."""
+
+    name = "line"
+    max_frame = LINE_LIMIT
+
+    def __init__(self, codec):
+        if codec.binary:
+            raise ValueError(f"codec {codec.name} cannot be line-framed")
+        self.codec = codec
+
+    def pack(self, payload):
+        return self.codec.dumps(payload) + b"\n"
+
+    def frame(self, body):
+        """Encadre un message déjà encodé."""
+        return body + b"\n"
+
+    def loads(self, frame):
+        return self.codec.loads(frame)
+
+    async def read(self, reader: asyncio.StreamReader):
+        """Retourne le prochain message brut, ou None en fin de flux."""
+        try:
+            data = await reader.readline()
+        except ValueError as e:
+            # ligne plus longue que la limite du StreamReader
+            raise FrameTooLarge(str(e)) from e
+        return data or None
+
+    def next_frame(self, buffer: bytearray):
+        """Extrait le prochain message complet de buffer, ou None."""
+        end = buffer.find(b"\n")
+        # limite vérifiée aussi quand la ligne entière est déjà reçue (un
+        # seul gros read), comme readline() dans le cœur "stream"
+        size = len(buffer) if end < 0 else end + 1
+        if size > self.max_frame:
+            raise FrameTooLarge(f"line longer than {self.max_frame} bytes")
+        if end < 0:
+            return None
+        frame = bytes(buffer[:end + 1])
+        del buffer[:end + 1]
+        return frame
+
+
+class LengthPrefixFraming:
+    """Taille sur 4 octets puis contenu : lecture en deux readexactly()."""
+
+    name = "length"
+    header = struct.Struct("!I")
+
+    def __init__(self, codec, max_frame=DEFAULT_MAX_FRAME):
+        self.codec = codec
+        self.max_frame = max_frame
+
+    def pack(self, payload):
+        return self.frame(self.codec.dumps(payload))
+
+    def frame(self, body):
+        """Encadre un message déjà encodé."""
+        return self.header.pack(len(body)) + body
+
+    def loads(self, frame):
+        return self.codec.loads(frame)
+
+    async def read(self, reader: asyncio.StreamReader):
+        """Retourne le prochain message brut, ou None en fin de flux."""
+        try:
+            head = await reader.readexactly(self.header.size)
+            (size,) = self.header.unpack(head)
+            if size > self.max_frame:
+                raise FrameTooLarge(f"frame of {size} bytes exceeds "
+                                    f"{self.max_frame}")
+            return await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return None
+
+    def next_frame(self, buffer: bytearray):
+        """Extrait le prochain message complet de buffer, ou None."""
+        if len(buffer) < self.header.size:
+            return None
+        (size,) = self.header.unpack_from(buffer)
+        if size > self.max_frame:
+            raise FrameTooLarge(f"frame of {size} bytes exceeds "
+                                f"{self.max_frame}")
+        end = self.header.size + size
+        if len(buffer) < end:
+            return None
+        frame = bytes(buffer[self.header.size:end])
+        del buffer[:end]
+        return frame
+
+
+def make_framing(name, codec, max_frame=DEFAULT_MAX_FRAME):
+    """Construit un framing ; ValueError si le nom ou le codec ne convient pas."""
+    if name == "line":
+        return LineFraming(codec)
+    if name == "length":
+        return LengthPrefixFraming(codec, max_frame)
+    raise ValueError(f"unknown framing: {name}")
@@ -0,0 +1,149 @@
+# metrics.py
+import asyncio
+import bisect
+
+# seuils par défaut (secondes) : de 50 µs à 1 s
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0,
+)
+
+
+class Histogram:
+    """Histogramme à seuils fixes, à la manière de Prometheus.
+
+    observe() ne fait qu'une recherche dichotomique et deux additions :
+    on peut l'appeler sur le chemin chaud.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # une case de plus pour les valeurs au-delà du dernier seuil (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Liste de (seuil, nombre de valeurs <= seuil), +Inf compris."""
+        result = []
+        total = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Estimation du quantile q (0..1) : le seuil de la case qui le contient."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float("inf")
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+# --- exposition au format texte de Prometheus (version 0.0.4) ---
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# délai max pour lire une requête HTTP de scrape
+HTTP_TIMEOUT = 5.0
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\")
+            .replace('"', '\\"').replace("\n", "\\n"))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"'
+                          for key, value in labels.items()) + "}"
+
+
+class Exposition:
+    """Page de métriques en construction, rendue par text()."""
+
+    def __init__(self):
+        self.lines = []
+
+    def header(self, name, kind, help_text):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, labels=None):
+        self.lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def gauge(self, name, help_text, value):
+        self.header(name, "gauge", help_text)
+        self.sample(name, value)
+
+    def counter(self, name, help_text, value):
+        self.header(name, "counter", help_text)
+        self.sample(name, value)
+
+    def histogram(self, name, help_text, series):
+        """series : liste de (labels, Histogram) ; labels peut être None."""
+        self.header(name, "histogram", help_text)
+        for labels, hist in series:
+            labels = labels or {}
+            for bound, total in hist.cumulative():
+                self.sample(f"{name}_bucket", total,
+                            {**labels, "le": _format_value(bound)})
+            self.sample(f"{name}_sum", hist.sum, labels)
+            self.sample(f"{name}_count", hist.count, labels)
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+async def start_http_server(render, host, port):
+    """Sert render() (texte d'exposition) en HTTP sur GET /metrics.
+
+    Serveur minimal sans dépendance : une requête par connexion, les
+    en-têtes sont ignorés. Retourne l'asyncio.Server.
+    """
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), HTTP_TIMEOUT)
+            while True:
+                line = await asyncio.wait_for(reader.readline(), HTTP_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request.split()
+            path = parts[1].split(b"?")[0] if len(parts) > 1 else b""
+            if parts and parts[0] == b"GET" and path in (b"/", b"/metrics"):
+                status, body = "200 OK", render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,399 @@
+# msglog.py
+"""Journal persistant des messages de salon (append-only, segmenté).
+
+Disposition dans --data-dir, un dossier par salon :
+
+    room-<nom>/room.json                  nom et options du salon
+    room-<nom>/00000000000000000001.log   segment (nommé d'après son 1er id)
+    room-<nom>/00000000000000000001.idx   offsets des messages du segment
+
+Un enregistrement = en-tête "!IQ" (taille, id du message) puis le message
+encodé en JSON. Les ids d'un salon se suivent (1, 2, 3...) : le message n
+est le (n - base)-ième de son segment et le .idx (un entier de 8 octets
+par message, ordre natif) donne directement son offset.
+
+Écriture : append() ne fait que mettre le message en attente. Une tâche de
+fond (run) écrit tout ce qui est en attente en un seul lot par segment
+(group commit), dans un thread pour ne pas bloquer la boucle, puis rend
+ces messages lisibles. Lecture : les segments sont projetés en mémoire
+(mmap) et les messages rendus sous forme d'octets JSON, sans décodage.
+"""
+import array
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+from urllib.parse import quote
+
+logger = logging.getLogger("chat-msglog")
+
+RECORD = struct.Struct("!IQ")
+
+# taille au-delà de laquelle on ouvre un nouveau segment
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+
+# délai de regroupement des écritures après le premier message en attente
+FLUSH_INTERVAL = 0.05
+
+META_FILE = "room.json"
+
+
+def room_dirname(room):
+    name = quote(room, safe="")
+    if len(name) > 200:
+        # limite de longueur des noms de fichiers ; le vrai nom est dans
+        # room.json
+        name = hashlib.sha1(room.encode()).hexdigest()
+    return "room-" + name
+
+
+class Segment:
+    def __init__(self, directory, base_id):
+        self.base_id = base_id
+        path = os.path.join(directory, f"{base_id:020d}")
+        self.log_path = path + ".log"
+        self.idx_path = path + ".idx"
+        self.offsets = array.array("Q")
+        self.size = 0              # octets écrits et lisibles
+        self.sealed = False        # plus d'écriture : le segment suivant existe
+        self._map = None
+        self._log_file = None      # ouverts par le thread d'écriture
+        self._idx_file = None
+
+    @property
+    def count(self):
+        return len(self.offsets)
+
+    def load(self):
+        """Relit l'index ; reconstruit à partir du .log s'il est incohérent."""
+        log_size = (os.path.getsize(self.log_path)
+                    if os.path.exists(self.log_path) else 0)
+        offsets = array.array("Q")
+        if os.path.exists(self.idx_path):
+            with open(self.idx_path, "rb") as f:
+                data = f.read()
+            offsets.frombytes(data[:len(data) - len(data) % offsets.itemsize])
+
+        end = self._check_last(offsets, log_size)
+        if end != log_size:
+            # arrêt brutal pendant une écriture : on repart du .log
+            offsets, end = self.scan()
+            logger.warning("Rebuilt index of %s (%d messages)",
+                           self.log_path, len(offsets))
+            with open(self.log_path, "ab") as f:
+                f.truncate(end)
+            with open(self.idx_path, "wb") as f:
+                offsets.tofile(f)
+        self.offsets = offsets
+        self.size = end
+
+    def _check_last(self, offsets, log_size):
+        """Fin du dernier enregistrement indexé, ou -1 s'il est invalide."""
+        if not offsets:
+            return 0
+        last = offsets[-1]
+        if last + RECORD.size > log_size:
+            return -1
+        with open(self.log_path, "rb") as f:
+            f.seek(last)
+            size, msg_id = RECORD.unpack(f.read(RECORD.size))
+        if msg_id != self.base_id + len(offsets) - 1:
+            return -1
+        return last + RECORD.size + size
+
+    def scan(self):
+        """Parcourt le .log ; retourne (offsets, fin du dernier message entier)."""
+        offsets = array.array("Q")
+        if not os.path.exists(self.log_path):
+            return offsets, 0
+        with open(self.log_path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            size, msg_id = RECORD.unpack_from(data, pos)
+            end = pos + RECORD.size + size
+            if end > len(data) or msg_id != self.base_id + len(offsets):
+                break
+            offsets.append(pos)
+            pos = end
+        return offsets, pos
+
+    def read(self, index):
+        """Octets JSON du index-ième message du segment."""
+        if self._map is None or len(self._map) < self.size:
+            # le fichier a grandi depuis la dernière projection
+            if self._map is not None:
+                self._map.close()
+            with open(self.log_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = self.offsets[index]
+        size, _ = RECORD.unpack_from(self._map, start)
+        start += RECORD.size
+        return self._map[start:start + size]
+
+    def write(self, data, offsets, fsync):
+        """Appelé dans le thread d'écriture."""
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "ab")
+            self._idx_file = open(self.idx_path, "ab")
+            # après un échec (voir discard_files), les fichiers peuvent
+            # contenir une partie d'un lot : on repart de ce qui est validé
+            self._log_file.truncate(self.size)
+            self._idx_file.truncate(self.count * self.offsets.itemsize)
+        self._log_file.write(data)
+        self._log_file.flush()
+        self._idx_file.write(offsets.tobytes())
+        self._idx_file.flush()
+        if fsync:
+            os.fsync(self._log_file.fileno())
+            os.fsync(self._idx_file.fileno())
+
+    def close_files(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._idx_file.close()
+            self._log_file = self._idx_file = None
+
+    def discard_files(self, remove=False):
+        """Après un échec d'écriture : ferme les fichiers sans vider leur
+        buffer ; la prochaine écriture les tronque à la taille validée."""
+        for f in (self._log_file, self._idx_file):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._log_file = self._idx_file = None
+        if remove:
+            for path in (self.log_path, self.idx_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.close_files()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class RoomLog:
+    """Journal d'un salon : liste de segments, ids consécutifs."""
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segments = []
+        self._bases = []           # base_id de chaque segment (bisect)
+        self.pending = []          # (id, payload) pas encore écrits
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        bases = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                       if name.endswith(".log") and name[:-4].isdigit())
+        for base in bases:
+            segment = Segment(self.directory, base)
+            segment.load()
+            if self.segments:
+                self.segments[-1].sealed = True
+            self.segments.append(segment)
+            self._bases.append(base)
+        return self
+
+    @property
+    def first_id(self):
+        return self._bases[0] if self._bases else 1
+
+    @property
+    def last_id(self):
+        """Id du dernier message lisible (0 si aucun)."""
+        for segment in reversed(self.segments):
+            if segment.count:
+                return segment.base_id + segment.count - 1
+        return self.first_id - 1
+
+    def read(self, msg_id):
+        i = bisect.bisect_right(self._bases, msg_id) - 1
+        segment = self.segments[i]
+        return segment.read(msg_id - segment.base_id)
+
+    def before(self, cursor, limit):
+        """Au plus `limit` messages d'id < cursor, du plus ancien au plus récent.
+
+        Retourne une liste de (id, octets JSON). Le coût ne dépend que de
+        limit et du nombre de segments, pas de la taille de l'historique.
+        """
+        end = min(cursor, self.last_id + 1)
+        start = max(self.first_id, end - limit)
+        return [(msg_id, self.read(msg_id)) for msg_id in range(start, end)]
+
+    def plan(self, encode):
+        """Prépare l'écriture des messages en attente (dans la boucle).
+
+        Retourne une liste de (segment, octets, offsets) ; les segments
+        nouveaux sont créés ici, vides, donc encore invisibles en lecture.
+        """
+        plans = []
+        segment = self.segments[-1] if self.segments else None
+        chunks, offsets, size = [], array.array("Q"), 0
+        for msg_id, payload in self.pending:
+            body = encode(payload)
+            record = RECORD.pack(len(body), msg_id) + body
+            if segment is None or (segment.size + size > self.segment_bytes
+                                   and segment.count + len(offsets)):
+                if chunks:
+                    plans.append((segment, b"".join(chunks), offsets))
+                if segment is not None:
+                    segment.sealed = True
+                segment = Segment(self.directory, msg_id)
+                self.segments.append(segment)
+                self._bases.append(msg_id)
+                chunks, offsets, size = [], array.array("Q"), 0
+            offsets.append(segment.size + size)
+            chunks.append(record)
+            size += len(record)
+        if chunks:
+            plans.append((segment, b"".join(chunks), offsets))
+        self.pending = []
+        return plans
+
+    def abort(self, pending, count):
+        """Annule un plan dont l'écriture a échoué.
+
+        Les messages repassent en tête de la file d'attente et les segments
+        créés par le plan (au-delà des `count` premiers) sont retirés ;
+        retourne ces derniers.
+        """
+        created = self.segments[count:]
+        del self.segments[count:]
+        del self._bases[count:]
+        if self.segments:
+            self.segments[-1].sealed = False
+        self.pending = pending + self.pending
+        return created
+
+
+class MessageLog:
+    """Ensemble des journaux de salons d'un répertoire --data-dir."""
+
+    def __init__(self, directory, codec, segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 fsync=False):
+        self.directory = directory
+        self.codec = codec
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.rooms = {}            # salon -> RoomLog
+        self._dirty = {}           # salons avec des messages en attente
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def open(self):
+        """Ouvre les journaux existants ; retourne {salon: options}."""
+        os.makedirs(self.directory, exist_ok=True)
+        found = {}
+        for name in sorted(os.listdir(self.directory)):
+            meta_path = os.path.join(self.directory, name, META_FILE)
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                meta = json.load(f)
+            room = meta.pop("room")
+            self.rooms[room] = RoomLog(os.path.join(self.directory, name),
+                                       self.segment_bytes).open()
+            found[room] = meta
+        return found
+
+    def create_room(self, room, **options):
+        """Crée le dossier du salon et y enregistre ses options."""
+        if room in self.rooms:
+            return self.rooms[room]
+        path = os.path.join(self.directory, room_dirname(room))
+        log = RoomLog(path, self.segment_bytes).open()
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump({"room": room, **options}, f)
+        # enregistré une fois le dossier complet
+        self.rooms[room] = log
+        return log
+
+    def append(self, room, msg_id, payload):
+        """Met un message en attente d'écriture ; ne fait aucune E/S."""
+        log = self.rooms.get(room)
+        if log is None:
+            # salon en cours de suppression
+            return
+        log.pending.append((msg_id, payload))
+        self._dirty[room] = log
+        self._wakeup.set()
+
+    async def delete_room(self, room):
+        """Supprime le journal d'un salon, messages en attente compris."""
+        log = self.rooms.pop(room, None)
+        if log is None:
+            return
+        self._dirty.pop(room, None)
+        # une écriture en cours peut encore utiliser ses segments
+        async with self._lock:
+            for segment in log.segments:
+                segment.close()
+            await asyncio.to_thread(shutil.rmtree, log.directory,
+                                    ignore_errors=True)
+
+    async def run(self):
+        """Tâche de fond : écrit les messages en attente par lots."""
+        while True:
+            await self._wakeup.wait()
+            # laisser s'accumuler les messages qui arrivent juste après
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            self._wakeup.clear()
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            plans, undo = [], []
+            for room, log in dirty.items():
+                undo.append((room, log, log.pending, len(log.segments)))
+                plans.extend(log.plan(self.codec.dumps))
+            try:
+                await asyncio.to_thread(self._write, plans)
+            except OSError as e:
+                logger.error("Failed to write message log: %s", e,
+                             extra={"event": "msglog_error"})
+                # les ids doivent rester consécutifs dans chaque segment :
+                # le lot entier sera réécrit au prochain flush (prochain
+                # message ou arrêt)
+                created = []
+                for room, log, pending, count in undo:
+                    created.extend(log.abort(pending, count))
+                    if self.rooms.get(room) is log:
+                        self._dirty[room] = log
+                await asyncio.to_thread(self._discard, plans, created)
+                return
+            # visibles en lecture seulement une fois écrits
+            for segment, data, offsets in plans:
+                segment.offsets.extend(offsets)
+                segment.size += len(data)
+
+    def _write(self, plans):
+        for segment, data, offsets in plans:
+            segment.write(data, offsets, self.fsync)
+            if segment.sealed:
+                segment.close_files()
+
+    def _discard(self, plans, created):
+        for segment, _, _ in plans:
+            segment.discard_files(remove=segment in created)
+
+    async def close(self):
+        await self.flush()
+        for log in self.rooms.values():
+            for segment in log.segments:
+                segment.close()
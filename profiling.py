@@ -0,0 +1,120 @@
+# profiling.py
+"""Profilage à chaud d'un ChatServer (cProfile).
+
+Le profileur est activé pour une durée donnée, sans redémarrer le serveur
+(action "admin_profile" ou signal SIGUSR1, voir server.py). À l'arrêt, il
+écrit un fichier pstats et, à côté, un JSON avec le nombre d'appels et le
+temps total de chaque action pendant la fenêtre profilée :
+
+    chat-profile-<pid>-<date>-<n>.pstats
+    chat-profile-<pid>-<date>-<n>.json
+
+    python -m pstats chat-profile-1234-20260101-120000-1.pstats
+"""
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger("chat-profiler")
+
+# durée par défaut et durée max d'une session (secondes)
+DEFAULT_PROFILE_SECONDS = 30.0
+MAX_PROFILE_SECONDS = 600.0
+
+
+class RuntimeProfiler:
+    def __init__(self, server, directory=None):
+        self.server = server
+        self.directory = directory or tempfile.gettempdir()
+        self._profile = None
+        self._timer = None
+        self._started = 0.0
+        self._actions = {}         # action -> (count, sum) au démarrage
+        self._sessions = 0         # numéro de session (noms de fichiers)
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def _action_snapshot(self):
+        return {name: (hist.count, hist.sum)
+                for name, hist in self.server.action_stats.items()}
+
+    def start(self, seconds=DEFAULT_PROFILE_SECONDS):
+        """Démarre une session de `seconds` secondes (arrêt automatique).
+
+        RuntimeError si une session est déjà en cours.
+        """
+        if self.running:
+            raise RuntimeError("profiler already running")
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        self._started = time.time()
+        self._sessions += 1
+        self._actions = self._action_snapshot()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self._timer = asyncio.get_running_loop().call_later(seconds,
+                                                            self.finish)
+        logger.info("Profiling for %.1f s", seconds,
+                    extra={"event": "profile_start", "seconds": seconds})
+
+    def stop(self):
+        """Arrête la session et écrit les fichiers ; retourne le .pstats.
+
+        OSError si les fichiers n'ont pas pu être écrits (la session est
+        arrêtée quand même).
+        """
+        if not self.running:
+            return None
+        self._profile.disable()
+        profile, self._profile = self._profile, None
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        elapsed = time.time() - self._started
+        actions = {}
+        for name, (count, total) in self._action_snapshot().items():
+            count0, total0 = self._actions.get(name, (0, 0.0))
+            if count > count0:
+                actions[name] = {"count": count - count0,
+                                 "seconds": total - total0}
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))
+        base = os.path.join(self.directory,
+                            f"chat-profile-{os.getpid()}-{stamp}-{self._sessions}")
+        try:
+            profile.dump_stats(base + ".pstats")
+            with open(base + ".json", "w") as f:
+                json.dump({"started": self._started, "duration_s": elapsed,
+                           "actions": actions}, f, indent=2, sort_keys=True)
+                f.write("\n")
+        except OSError as e:
+            logger.error("Could not write profile %s: %s", base, e,
+                         extra={"event": "profile_error", "path": base})
+            raise
+        logger.info("Profile written to %s.pstats (%.1f s, %d actions)",
+                    base, elapsed, sum(a["count"] for a in actions.values()),
+                    extra={"event": "profile_stop", "path": base + ".pstats",
+                           "duration_s": elapsed})
+        return base + ".pstats"
+
+    def finish(self):
+        """Comme stop(), pour un appelant qui ne peut pas répondre (fin de
+        la durée, SIGUSR1, arrêt du serveur) : l'erreur est seulement
+        journalisée."""
+        try:
+            self.stop()
+        except OSError:
+            pass
+
+    def toggle(self, seconds=DEFAULT_PROFILE_SECONDS):
+        """Pour SIGUSR1 : démarre une session, ou arrête celle en cours."""
+        if self.running:
+            self.finish()
+        else:
+            self.start(seconds)
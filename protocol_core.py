@@ -0,0 +1,144 @@
+# protocol_core.py
+"""Cœur "protocol" du serveur : asyncio.Protocol au lieu des streams.
+
+Pas de StreamReader : data_received() accumule les octets dans un
+bytearray et une seule tâche, créée à la demande, découpe et traite tous
+les messages complets d'un coup. Les actions sont celles de ChatServer,
+via les mêmes open_connection / handle_frame / close_connection que le
+cœur "stream".
+"""
+import asyncio
+import logging
+
+from framing import FrameTooLarge
+
+logger = logging.getLogger("chat-server")
+
+# au-delà de ce volume reçu mais pas encore traité, on arrête de lire
+# jusqu'à ce que la tâche de traitement ait rattrapé son retard
+READ_HIGH = 256 * 1024
+
+
+class TransportWriter:
+    """Interface minimale de StreamWriter utilisée par ClientConnection."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._paused = False
+        self._drain_waiter = None
+        self._closed = asyncio.get_running_loop().create_future()
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        if self.transport.is_closing():
+            raise ConnectionResetError("Connection lost")
+        if not self._paused:
+            return
+        self._drain_waiter = asyncio.get_running_loop().create_future()
+        await self._drain_waiter
+
+    def close(self):
+        self.transport.close()
+
+    async def wait_closed(self):
+        await asyncio.shield(self._closed)
+
+    # appelés par ChatProtocol
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self, exc=None):
+        self._paused = False
+        waiter, self._drain_waiter = self._drain_waiter, None
+        if waiter is not None and not waiter.done():
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    def connection_lost(self, exc):
+        self.resume_writing(exc or ConnectionResetError("Connection lost"))
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+
+class ChatProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.writer = None
+        self.conn = None
+        self.buffer = bytearray()
+        self.reading_paused = False
+        self.lost = False
+        self._pump_task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.writer = TransportWriter(transport)
+        self.conn = self.server.open_connection(self.writer)
+
+    def data_received(self, data):
+        self.buffer += data
+        if len(self.buffer) > READ_HIGH and not self.reading_paused:
+            self.transport.pause_reading()
+            self.reading_paused = True
+        self._wake()
+
+    def connection_lost(self, exc):
+        self.lost = True
+        self.writer.connection_lost(exc)
+        self._wake()
+
+    def pause_writing(self):
+        self.writer.pause_writing()
+
+    def resume_writing(self):
+        self.writer.resume_writing()
+
+    def _wake(self):
+        if self._pump_task is None:
+            self._pump_task = asyncio.get_running_loop().create_task(
+                self._pump()
+            )
+
+    async def _pump(self):
+        """Traite tous les messages complets du buffer, dans l'ordre."""
+        conn = self.conn
+        close = self.lost
+        try:
+            while conn is not None:
+                # le framing peut changer après "register" : on le relit
+                # pour chaque message
+                try:
+                    frame = conn.framing.next_frame(self.buffer)
+                except FrameTooLarge:
+                    await self.server.send_error(conn, "message too large")
+                    close = True  # impossible de se resynchroniser
+                    break
+                if frame is None:
+                    break
+                await self.server.handle_frame(frame, conn)
+
+            # plus aucun message complet : il faut relire, même si un gros
+            # message partiel occupe encore le buffer
+            if self.reading_paused and not close:
+                self.reading_paused = False
+                self.transport.resume_reading()
+        except Exception as e:
+            logger.exception("Error with client %s: %s", conn.peer, e,
+                             extra={"event": "client_error", "peer": conn.peer})
+            close = True
+        finally:
+            if (close or self.lost) and conn is not None:
+                # close_connection vide la file de sortie avant de fermer
+                self.conn = None
+                self.buffer.clear()
+                await self.server.close_connection(conn)
+            self._pump_task = None
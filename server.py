@@ -1,15 +1,82 @@
 # server.py
+import argparse
 import asyncio
-import json
+import collections
+import hmac
 import logging
+import multiprocessing
+import os
+import signal
 import socket
+import tempfile
+import time
+
+from bus import BusClient, BusHub
+from chatlog import FORMATTERS, RateLimiter, setup_logging
+from codec import CODECS, CodecError, get_codec
+from framing import DEFAULT_MAX_FRAME, FrameTooLarge, make_framing
+from metrics import Exposition, Histogram, start_http_server
+from msglog import DEFAULT_SEGMENT_BYTES, MessageLog
+from profiling import DEFAULT_PROFILE_SECONDS, RuntimeProfiler
+from protocol_core import ChatProtocol
+
+try:
+    import uvloop
+except ImportError:  # dépendance optionnelle
+    uvloop = None
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s] %(levelname)s:%(name)s: %(message)s'
-)
 logger = logging.getLogger("chat-server")
 
+# au-delà de ce délai, un drain vers un membre est signalé comme lent
+SLOW_DRAIN_SECONDS = 0.5
+
+# taille par défaut de la file de sortie de chaque client (en messages)
+DEFAULT_QUEUE_SIZE = 1000
+
+# politiques quand la file de sortie d'un client est pleine
+DROP_OLDEST = "drop_oldest"    # on jette le plus ancien message en attente
+DROP_NEWEST = "drop_newest"    # on jette le message qu'on voulait envoyer
+DISCONNECT = "disconnect"      # on coupe le client trop lent
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+# seuils sur le buffer d'écriture du transport (en octets) : au-dessus de
+# HIGH le client est marqué lent, il redevient normal sous LOW
+DEFAULT_BUFFER_HIGH = 1024 * 1024
+DEFAULT_BUFFER_LOW = 256 * 1024
+# un client qui reste lent plus longtemps que ça est expulsé
+DEFAULT_SLOW_TIMEOUT = 10.0
+# période de vérification des buffers
+SLOW_CHECK_INTERVAL = 1.0
+
+# file d'attente des connexions entrantes (listen) ; la valeur par défaut
+# d'asyncio (100) déborde dès qu'une rafale de clients se connecte
+DEFAULT_BACKLOG = 1024
+
+# implémentations du serveur : "stream" (StreamReader/Writer, une tâche
+# par client) ou "protocol" (asyncio.Protocol, voir protocol_core.py)
+CORES = ("stream", "protocol")
+
+# nombre max de réponses "error" gardées encodées en cache
+MAX_CACHED_ERRORS = 256
+
+# nombre de messages récents gardés par salon et rejoués à l'arrivée
+# (par défaut, et maximum accepté dans create_room)
+DEFAULT_HISTORY_SIZE = 50
+MAX_HISTORY_SIZE = 1000
+
+# taille par défaut et taille max d'une page de fetch_history
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# période de mesure du retard de la boucle d'événements (secondes)
+LOOP_LAG_INTERVAL = 0.5
+# retard (ou durée d'un callback, en mode --loop-debug) signalé comme anormal
+DEFAULT_LAG_THRESHOLD = 0.1
+
+# nombre max de messages de chat journalisés par seconde (0 : aucun) ;
+# au-delà, ils sont seulement comptés
+DEFAULT_MESSAGE_LOG_RATE = 20.0
+
 
 def get_local_ip():
     """Retourne l'IP locale probable de la machine."""
@@ -25,143 +92,757 @@ def get_local_ip():
     return ip
 
 
+def action(name):
+    """Déclare une méthode de ChatServer comme handler de l'action `name`.
+
+    Le handler est appelé avec (message, conn) ; l'utilisateur enregistré
+    sur la connexion est disponible dans conn.username.
+    """
+    def decorator(func):
+        func.action_name = name
+        return func
+    return decorator
+
+
+class ClientConnection:
+    """Connexion d'un client avec sa file de sortie bornée.
+
+    Les handlers ne touchent plus au StreamWriter : ils déposent des octets
+    dans la file via send(), et une tâche dédiée les écrit sur le socket.
+    Un pair lent ne ralentit donc que sa propre tâche d'écriture.
+    """
+
+    def __init__(self, writer, max_queue=DEFAULT_QUEUE_SIZE,
+                 overflow=DROP_OLDEST, buffer_high=DEFAULT_BUFFER_HIGH,
+                 buffer_low=DEFAULT_BUFFER_LOW, on_evict=None, framing=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        if buffer_low > buffer_high:
+            raise ValueError("buffer_low must not exceed buffer_high")
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.buffer_high = buffer_high
+        self.buffer_low = buffer_low
+        self.on_evict = on_evict
+        self.username = None       # renseigné par l'action "register"
+        self.framing = framing     # découpage/encodage des messages
+
+        self.queue = collections.deque()
+        self.dropped = 0           # messages perdus à cause de la file pleine
+        # comptés par lot dans _writer_loop, pas à chaque send()
+        self.messages_out = 0      # messages écrits vers ce client
+        self.bytes_out = 0
+        self.last_drain = 0.0      # durée du dernier drain (secondes)
+        self.slow_since = None     # instant du passage au-dessus de HIGH
+        self.closing = False
+
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        # drain() bloque au-dessus de HIGH et reprend sous LOW
+        self.writer.transport.set_write_buffer_limits(
+            high=self.buffer_high, low=self.buffer_low
+        )
+        self._task = asyncio.create_task(self._writer_loop())
+
+    @property
+    def buffer_size(self):
+        """Octets acceptés par le transport mais pas encore envoyés."""
+        return self.writer.transport.get_write_buffer_size()
+
+    @property
+    def slow(self):
+        return self.slow_since is not None
+
+    def check_slow(self, now, timeout):
+        """Met à jour l'état « lent » ; retourne True si le délai est dépassé."""
+        size = self.buffer_size
+        if self.slow_since is None:
+            if size > self.buffer_high:
+                self.slow_since = now
+                logger.warning("Slow consumer %s: %d bytes buffered",
+                               self.peer, size,
+                               extra={"event": "slow_consumer",
+                                      "peer": self.peer, "buffered": size})
+            return False
+        if size < self.buffer_low:
+            self.slow_since = None
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Consumer %s caught up", self.peer,
+                            extra={"event": "caught_up", "peer": self.peer})
+            return False
+        return now - self.slow_since > timeout
+
+    def send(self, data):
+        """Met des octets en file ; retourne False si le message est perdu."""
+        if self.closing:
+            return False
+
+        if len(self.queue) >= self.max_queue:
+            if self.overflow == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            if self.overflow == DISCONNECT:
+                self.evict("queue_full")
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+
+        self.queue.append(data)
+        self._ready.set()
+        return True
+
+    async def _writer_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                if not self.queue:
+                    if self.closing:
+                        break
+                    continue
+
+                # tout ce qui est en attente part en un seul write ; pas de
+                # writelines() : sur certaines versions il ne met pas le
+                # protocole en pause et drain() ne bloque alors jamais
+                data = b"".join(self.queue)
+                self.messages_out += len(self.queue)
+                self.bytes_out += len(data)
+                self.queue.clear()
+                self.writer.write(data)
+
+                start = time.perf_counter()
+                await self.writer.drain()
+                self.last_drain = time.perf_counter() - start
+                if self.last_drain > SLOW_DRAIN_SECONDS:
+                    logger.warning("Slow delivery to %s: %.1f ms",
+                                   self.peer, self.last_drain * 1000,
+                                   extra={"event": "slow_delivery",
+                                          "peer": self.peer,
+                                          "drain_s": self.last_drain})
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning("Failed to send to %s: %s", self.peer, e,
+                           extra={"event": "send_failed", "peer": self.peer})
+        finally:
+            self.closing = True
+            self.queue.clear()
+
+    def abort(self):
+        """Coupe immédiatement la connexion (sans vider la file)."""
+        self.closing = True
+        self.queue.clear()
+        self._ready.set()
+        self.writer.transport.abort()
+
+    def evict(self, reason):
+        """Expulse un client trop lent et prévient le serveur."""
+        if self.closing:
+            return
+        logger.warning("Evicting slow consumer %s (%s)", self.peer, reason,
+                       extra={"event": "evict", "peer": self.peer,
+                              "reason": reason})
+        self.abort()
+        if self.on_evict:
+            self.on_evict(self, reason)
+
+    async def close(self):
+        """Vide ce qui reste dans la file puis ferme le socket."""
+        self.closing = True
+        self._ready.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, SLOW_DRAIN_SECONDS)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class SlowCallbackFilter(logging.Filter):
+    """Compte les avertissements « Executing ... took ... » d'asyncio.
+
+    asyncio ne les émet qu'en mode debug (--loop-debug), pour tout callback
+    plus long que loop.slow_callback_duration. Le filtre ajoute à
+    l'enregistrement la dernière action démarrée : c'est en général elle
+    qui tournait pendant ce callback.
+    """
+
+    def __init__(self, server):
+        super().__init__()
+        self.server = server
+
+    def filter(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith("Executing "):
+            action = self.server.last_action or "-"
+            self.server.slow_callbacks[action] += 1
+            record.event = "slow_callback"
+            record.action = action
+        return True
+
+
 class ChatServer:
-    def __init__(self, host, port=8888):
+    def __init__(self, host, port=8888, max_queue=DEFAULT_QUEUE_SIZE,
+                 overflow=DROP_OLDEST, buffer_high=DEFAULT_BUFFER_HIGH,
+                 buffer_low=DEFAULT_BUFFER_LOW,
+                 slow_timeout=DEFAULT_SLOW_TIMEOUT, codec=None,
+                 max_frame=DEFAULT_MAX_FRAME, core="stream", reuse_port=False,
+                 backlog=DEFAULT_BACKLOG,
+                 message_log_rate=DEFAULT_MESSAGE_LOG_RATE,
+                 metrics_host="127.0.0.1", metrics_port=None,
+                 lag_threshold=DEFAULT_LAG_THRESHOLD, loop_debug=False,
+                 admin_token=None, profile_dir=None,
+                 history_size=DEFAULT_HISTORY_SIZE, store=None):
+        if core not in CORES:
+            raise ValueError(f"unknown server core: {core}")
+        # vérifié ici une fois pour toutes, pas à chaque connexion
+        if buffer_low > buffer_high:
+            raise ValueError("buffer_low must not exceed buffer_high")
         self.host = host
         self.port = port
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.buffer_high = buffer_high
+        self.buffer_low = buffer_low
+        self.slow_timeout = slow_timeout
+        self.core = core
+        self.backlog = backlog
+        # plusieurs processus écoutant sur le même port (mode --workers)
+        self.reuse_port = reuse_port
+        # BusClient vers les autres workers, None en mode mono-processus
+        self.bus = None
+        self.codec = codec or get_codec()
+        self.max_frame = max_frame
+        # (framing, encodage) -> instance partagée par les connexions ;
+        # sert aussi de clé pour les caches de messages encodés
+        self._framings = {}
+        self.default_framing = self.get_framing()
+
+        # toutes les connexions ouvertes, enregistrées ou non
+        self.connections = set()
 
-        # username -> {"writer": StreamWriter, "room": "general" | None}
+        # raison -> nombre de clients expulsés ("slow_consumer", "queue_full")
+        self.evictions = collections.Counter()
+
+        # limite les logs "Message from ..." (un par message de chat)
+        self.message_log = RateLimiter(message_log_rate)
+
+        # endpoint HTTP des métriques (désactivé si metrics_port est None)
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        # compteurs tenus au fil de l'eau ; les compteurs de sortie sont
+        # par connexion, ceux des connexions fermées sont cumulés ici
+        self.messages_in = 0
+        self.bytes_in = 0
+        self._closed_out = collections.Counter()
+        # durée de la livraison locale d'un message de salon
+        self.fanout_stats = Histogram()
+        # retard de la boucle d'événements (voir watch_loop_lag)
+        self.loop_lag = 0.0
+        self.loop_lag_stats = Histogram()
+        self.lag_threshold = lag_threshold
+        self.loop_debug = loop_debug
+        # action -> nombre de pics de retard / de callbacks lents pendant
+        # lesquels elle était la plus lente (ou la dernière) à tourner
+        self.lag_spikes = collections.Counter()
+        self.slow_callbacks = collections.Counter()
+        # dernière action démarrée, et la plus lente depuis la dernière
+        # mesure du retard (nom, durée) ; mises à jour par dispatch()
+        self.last_action = None
+        self._slowest_action = (None, 0.0)
+
+        # jeton des actions d'administration (None : actions désactivées)
+        self.admin_token = admin_token
+        # cProfile activable à chaud (admin_profile, SIGUSR1)
+        self.profiler = RuntimeProfiler(self, profile_dir)
+
+        # username -> {"conn": ClientConnection, "room": "general" | None}
         self.clients = {}
 
         # room_name -> set(usernames)
         self.rooms = {"general": set()}  # salon par défaut
 
+        # room_name -> deque bornée des derniers messages du salon ; chaque
+        # entrée est (payload, {framing: octets déjà encodés}), remplie au
+        # fil des framings rencontrés : le rejeu ne réencode presque rien
+        self.history_size = history_size
+        self.history = {"general": collections.deque(maxlen=history_size)}
+        # room_name -> id du dernier message (ids consécutifs par salon)
+        self.message_ids = collections.Counter()
+        # journal persistant des messages (MessageLog, --data-dir) ou None
+        self.store = store
+
+        # framing -> réponse "room_list" déjà encodée ; à invalider dès que
+        # la liste des salons change (voir invalidate_room_list)
+        self._room_list_data = {}
+        # (framing, message) -> réponse "error" encodée (ce sont des constantes)
+        self._error_data = {}
+
+        # action -> coroutine(message, conn), construit à partir des
+        # méthodes décorées par @action ; voir aussi register_action
+        self.actions = {}
+        # action -> Histogram des durées de traitement (count = nb d'appels)
+        self.action_stats = {}
+        for cls in reversed(type(self).__mro__):
+            for attr in vars(cls).values():
+                name = getattr(attr, "action_name", None)
+                if name:
+                    self.register_action(name, getattr(self, attr.__name__))
+
+    def register_action(self, name, handler):
+        """Ajoute (ou remplace) le handler d'une action du protocole."""
+        self.actions[name] = handler
+        self.action_stats.setdefault(name, Histogram())
+
     async def start(self):
-        server = await asyncio.start_server(
-            self.handle_client, self.host, self.port
-        )
+        loop = asyncio.get_running_loop()
+        store_task = None
+        if self.store is not None:
+            self.restore_rooms()
+            store_task = asyncio.create_task(self.store.run())
+        if self.core == "protocol":
+            server = await loop.create_server(
+                lambda: ChatProtocol(self), self.host, self.port,
+                reuse_port=self.reuse_port or None, backlog=self.backlog
+            )
+        else:
+            server = await asyncio.start_server(
+                self.handle_client, self.host, self.port,
+                reuse_port=self.reuse_port or None, backlog=self.backlog
+            )
+        watchdog = asyncio.create_task(self.watch_slow_consumers())
+        lag_task = asyncio.create_task(self.watch_loop_lag())
+        loop.slow_callback_duration = self.lag_threshold
+        slow_filter = None
+        if self.loop_debug:
+            # coûteux : à réserver au diagnostic
+            loop.set_debug(True)
+            slow_filter = SlowCallbackFilter(self)
+            logging.getLogger("asyncio").addFilter(slow_filter)
+        # SIGUSR1 : démarre une session de profilage, ou arrête la session
+        # en cours (pas de signaux sous Windows ni hors du thread principal)
+        on_sigusr1 = False
+        if hasattr(signal, "SIGUSR1"):
+            try:
+                loop.add_signal_handler(signal.SIGUSR1, self.profiler.toggle)
+                on_sigusr1 = True
+            except (NotImplementedError, RuntimeError):
+                pass
+        metrics_server = None
+        if self.metrics_port is not None:
+            metrics_server = await start_http_server(
+                self.render_metrics, self.metrics_host, self.metrics_port
+            )
+            logger.info("Metrics on http://%s:%d/metrics",
+                        self.metrics_host, self.metrics_port,
+                        extra={"event": "metrics_started",
+                               "port": self.metrics_port})
 
         # IP "réelle" de la machine (pour les clients)
         ip_locale = get_local_ip()
 
         # Log propre, sans ('0.0.0.0', 8888)
-        logger.info(f"Server started on {ip_locale}:{self.port}")
+        impl = loop_name(loop)
+        logger.info("Server started on %s:%s (core: %s, codec: %s, loop: %s)",
+                    ip_locale, self.port, self.core, self.codec.name, impl,
+                    extra={"event": "started", "port": self.port,
+                           "core": self.core, "codec": self.codec.name,
+                           "loop": impl})
+
+        try:
+            # le serveur écoute déjà ; pas de serve_forever() : une fois
+            # annulé, il attend dans wait_closed() que chaque client se
+            # déconnecte de lui-même, et l'arrêt (Ctrl+C) reste bloqué
+            await loop.create_future()
+        finally:
+            server.close()
+            for conn in list(self.connections):
+                conn.abort()
+            await server.wait_closed()
+            watchdog.cancel()
+            lag_task.cancel()
+            if slow_filter:
+                logging.getLogger("asyncio").removeFilter(slow_filter)
+            if on_sigusr1:
+                loop.remove_signal_handler(signal.SIGUSR1)
+            self.profiler.finish()
+            if store_task:
+                store_task.cancel()
+                await self.store.close()
+            if metrics_server:
+                metrics_server.close()
+
+    def restore_rooms(self):
+        """Recharge salons, ids et historique récent depuis le journal."""
+        for room, options in self.store.open().items():
+            self.add_room(room, options.get("history"))
+            log = self.store.rooms[room]
+            self.message_ids[room] = log.last_id
+            history = self.history[room]
+            if not history.maxlen:
+                continue
+            # le journal contient du JSON : déjà encodé pour le framing
+            # par défaut
+            framing = self.default_framing
+            for _, body in log.before(log.last_id + 1, history.maxlen):
+                history.append((self.codec.loads(body),
+                                {framing: framing.frame(body)}))
+        if "general" not in self.store.rooms:
+            self.store.create_room("general", history=self.history_size)
+
+    @property
+    def slow_clients(self):
+        """Nombre de connexions actuellement au-dessus du seuil HIGH."""
+        return sum(1 for conn in self.connections if conn.slow)
+
+    async def watch_slow_consumers(self):
+        """Surveille les buffers d'écriture et expulse les clients bloqués."""
+        while True:
+            await asyncio.sleep(SLOW_CHECK_INTERVAL)
+            now = time.monotonic()
+            for conn in list(self.connections):
+                if conn.check_slow(now, self.slow_timeout):
+                    conn.evict("slow_consumer")
 
-        async with server:
-            await server.serve_forever()
+    async def watch_loop_lag(self):
+        """Mesure le retard avec lequel la boucle reprend un sleep()."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(0.0, loop.time() - start - LOOP_LAG_INTERVAL)
+            self.loop_lag = lag
+            self.loop_lag_stats.observe(lag)
+
+            name, duration = self._slowest_action
+            self._slowest_action = (None, 0.0)
+            if lag >= self.lag_threshold:
+                self.lag_spikes[name or "-"] += 1
+                logger.warning("Event loop lag %.1f ms (slowest action: %s, "
+                               "%.1f ms)", lag * 1000, name or "-",
+                               duration * 1000,
+                               extra={"event": "loop_lag", "lag_s": lag,
+                                      "action": name,
+                                      "action_s": duration})
+
+    def on_evict(self, conn, reason):
+        self.evictions[reason] += 1
+
+    def get_framing(self, name="line", encoding="json"):
+        """Framing partagé pour ce couple ; ValueError s'il n'est pas supporté."""
+        key = (name, encoding)
+        framing = self._framings.get(key)
+        if framing is None:
+            if encoding == "json":
+                codec = self.codec
+            elif encoding == "msgpack":
+                try:
+                    codec = get_codec(encoding)
+                except ImportError as e:
+                    raise ValueError(str(e)) from e
+            else:
+                raise ValueError(f"unknown encoding: {encoding}")
+            framing = make_framing(name, codec, self.max_frame)
+            self._framings[key] = framing
+        return framing
 
     async def handle_client(self, reader: asyncio.StreamReader,
                             writer: asyncio.StreamWriter):
-        peer = writer.get_extra_info('peername')
-        logger.info(f"New connection from {peer}")
-        username = None
+        """Cœur "stream" : une tâche par client qui lit message par message."""
+        conn = self.open_connection(writer)
 
         try:
             while True:
-                data = await reader.readline()
-                if not data:
-                    break  # client déconnecté
-
+                # le framing peut changer après "register" : on le relit
+                # à chaque tour
                 try:
-                    message = json.loads(data.decode().strip())
-                except json.JSONDecodeError:
-                    await self.send_error(writer, "Invalid JSON")
-                    continue
+                    data = await conn.framing.read(reader)
+                except FrameTooLarge:
+                    await self.send_error(conn, "message too large")
+                    break  # impossible de se resynchroniser sur le flux
+                if data is None:
+                    break  # client déconnecté
 
-                action = message.get("action")
-                if action == "register":
-                    username = await self.handle_register(message, writer)
-                elif action == "list_rooms":
-                    await self.handle_list_rooms(writer)
-                elif action == "create_room":
-                    await self.handle_create_room(message, writer, username)
-                elif action == "join_room":
-                    await self.handle_join_room(message, writer, username)
-                elif action == "leave_room":
-                    await self.handle_leave_room(writer, username)
-                elif action == "send_message":
-                    await self.handle_send_message(message, writer, username)
-                else:
-                    await self.send_error(writer, "Unknown action")
+                await self.handle_frame(data, conn)
         except asyncio.CancelledError:
             pass
         except Exception as e:
-            logger.exception(f"Error with client {peer}: {e}")
+            logger.exception("Error with client %s: %s", conn.peer, e,
+                             extra={"event": "client_error", "peer": conn.peer})
+        finally:
+            await self.close_connection(conn)
+
+    def open_connection(self, writer):
+        """Crée et démarre la ClientConnection d'un nouveau client."""
+        conn = ClientConnection(
+            writer, self.max_queue, self.overflow,
+            buffer_high=self.buffer_high, buffer_low=self.buffer_low,
+            on_evict=self.on_evict, framing=self.default_framing,
+        )
+        conn.start()
+        self.connections.add(conn)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("New connection from %s", conn.peer,
+                        extra={"event": "connect", "peer": conn.peer})
+        return conn
+
+    async def close_connection(self, conn):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Connection closed: %s", conn.peer,
+                        extra={"event": "disconnect", "peer": conn.peer})
+        self.connections.discard(conn)
+        self._closed_out["messages"] += conn.messages_out
+        self._closed_out["bytes"] += conn.bytes_out
+        self._closed_out["dropped"] += conn.dropped
+        if conn.username:
+            await self.cleanup_client(conn.username)
+        await conn.close()
+
+    async def handle_frame(self, data, conn):
+        """Décode un message brut reçu et le passe à dispatch()."""
+        self.messages_in += 1
+        self.bytes_in += len(data)
+        try:
+            message = conn.framing.loads(data)
+        except CodecError:
+            await self.send_error(conn, "Invalid JSON")
+            return
+        if not isinstance(message, dict):
+            await self.send_error(conn, "Invalid JSON")
+            return
+
+        await self.dispatch(message, conn)
+
+    async def dispatch(self, message, conn):
+        """Appelle le handler de l'action demandée et mesure sa durée."""
+        name = message.get("action")
+        handler = self.actions.get(name)
+        if handler is None:
+            await self.send_error(conn, "Unknown action")
+            return
+
+        self.last_action = name
+        start = time.perf_counter()
+        try:
+            await handler(message, conn)
         finally:
-            logger.info(f"Connection closed: {peer}")
-            if username:
-                await self.cleanup_client(username)
-            writer.close()
-            await writer.wait_closed()
+            elapsed = time.perf_counter() - start
+            self.action_stats[name].observe(elapsed)
+            if elapsed > self._slowest_action[1]:
+                self._slowest_action = (name, elapsed)
+
+    @action("register")
+    async def handle_register(self, msg, conn):
+        if conn.username:
+            await self.send_error(conn, "already registered")
+            return
 
-    async def handle_register(self, msg, writer):
         username = msg.get("username")
         if not username:
-            await self.send_error(writer, "username required")
-            return None
+            await self.send_error(conn, "username required")
+            return
 
         if username in self.clients:
-            await self.send_error(writer, "username already taken")
-            return None
+            await self.send_error(conn, "username already taken")
+            return
+
+        # en multi-workers, le pseudo doit aussi être libre sur les autres
+        if self.bus:
+            if not await self.bus.claim_user(username):
+                await self.send_error(conn, "username already taken")
+                return
+            if conn.closing:
+                # parti pendant qu'on interrogeait le bus
+                self.bus.release_user(username)
+                return
+
+        # framing demandé par le client (NDJSON si rien n'est précisé)
+        name = msg.get("framing", "line")
+        encoding = msg.get("encoding", "json")
+        try:
+            if not isinstance(name, str) or not isinstance(encoding, str):
+                raise ValueError("framing and encoding must be strings")
+            framing = self.get_framing(name, encoding)
+        except ValueError as e:
+            if self.bus:
+                self.bus.release_user(username)
+            await self.send_error(conn, f"unsupported framing: {e}")
+            return
 
         # Enregistrer le client et l'ajouter au salon "general"
-        self.clients[username] = {"writer": writer, "room": "general"}
+        self.clients[username] = {"conn": conn, "room": "general"}
         self.rooms["general"].add(username)
+        conn.username = username
 
-        await self.send_json(writer, {
+        # la réponse part encore dans l'ancien framing ; tout ce qui suit
+        # (dans les deux sens) utilise le nouveau
+        await self.send_json(conn, {
             "type": "info",
             "message": f"Registered as {username}",
-            "room": "general"
+            "room": "general",
+            "framing": framing.name,
+            "encoding": encoding
         })
-        logger.info(f"User registered: {username}")
-        return username
+        conn.framing = framing
+        # comme pour join_room : l'arrivant voit la fin de la conversation
+        self.replay_history("general", conn)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("User registered: %s", username,
+                        extra={"event": "register", "user": username,
+                               "peer": conn.peer, "framing": framing.name})
 
-    async def handle_list_rooms(self, writer):
-        await self.send_json(writer, {
-            "type": "room_list",
-            "rooms": list(self.rooms.keys())
-        })
+    @action("list_rooms")
+    async def handle_list_rooms(self, msg, conn):
+        conn.send(self.room_list_data(conn.framing))
+
+    def room_list_data(self, framing=None):
+        """Octets de la réponse "room_list", encodés une fois par framing."""
+        framing = framing or self.default_framing
+        data = self._room_list_data.get(framing)
+        if data is None:
+            data = self._room_list_data[framing] = framing.pack({
+                "type": "room_list",
+                "rooms": list(self.rooms.keys())
+            })
+        return data
 
-    async def handle_create_room(self, msg, writer, username):
+    def invalidate_room_list(self):
+        self._room_list_data.clear()
+
+    @action("create_room")
+    async def handle_create_room(self, msg, conn):
+        username = conn.username
         if not username:
-            await self.send_error(writer, "register first")
+            await self.send_error(conn, "register first")
             return
 
         room = msg.get("room")
         if not room:
-            await self.send_error(writer, "room name required")
+            await self.send_error(conn, "room name required")
+            return
+        # le nom sert aussi de nom de dossier du journal (--data-dir)
+        if not isinstance(room, str):
+            await self.send_error(conn, "invalid room name")
+            return
+
+        # taille de l'historique propre à ce salon (optionnelle)
+        history = msg.get("history", self.history_size)
+        if (not isinstance(history, int) or isinstance(history, bool)
+                or not 0 <= history <= MAX_HISTORY_SIZE):
+            await self.send_error(conn, "invalid history size")
             return
 
         if room in self.rooms:
-            await self.send_error(writer, "room already exists")
+            await self.send_error(conn, "room already exists")
             return
 
-        self.rooms[room] = set()
-        logger.info(f"Room created: {room}")
+        # le hub tranche si deux workers créent le même salon en même temps
+        if self.bus and not await self.bus.create_room(room, history):
+            await self.send_error(conn, "room already exists")
+            return
 
-        # Info au créateur
-        await self.send_json(writer, {
+        try:
+            self.add_room(room, history)
+        except OSError as e:
+            logger.error("Could not create room %s: %s", room, e,
+                         extra={"event": "room_create_failed", "room": room})
+            await self.send_error(conn, "could not create room")
+            return
+
+        # Info au créateur ; lui comme les autres clients reçoivent
+        # "room_added" (voir add_room), pas toute la liste
+        await self.send_json(conn, {
             "type": "info",
             "message": f"Room '{room}' created"
         })
-        # En plus : renvoyer la liste des salons à jour à ce client
-        await self.send_json(writer, {
-            "type": "room_list",
-            "rooms": list(self.rooms.keys())
-        })
 
-    async def handle_join_room(self, msg, writer, username):
+    def add_room(self, room, history=None):
+        if room in self.rooms:
+            return
+        if history is None:
+            history = self.history_size
+        if self.store is not None:
+            # d'abord le journal : s'il ne peut pas être créé (OSError),
+            # le salon n'existe pas non plus en mémoire
+            self.store.create_room(room, history=history)
+        self.rooms[room] = set()
+        self.history[room] = collections.deque(maxlen=history)
+        self.invalidate_room_list()
+        self.notify_rooms("room_added", room)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Room created: %s", room,
+                        extra={"event": "room_created", "room": room})
+
+    async def remove_room(self, room):
+        """Supprime un salon : ses membres en sortent, son historique aussi."""
+        if room not in self.rooms:
+            return
+        if self.store is not None:
+            # avant de retirer le salon : tant qu'il existe, un salon du
+            # même nom ne peut pas être recréé dans le dossier supprimé
+            await self.store.delete_room(room)
+            if room not in self.rooms:
+                # supprimé entre-temps par un autre appel
+                return
+        members = self.rooms.pop(room)
+        left = {}
+        for user in members:
+            info = self.clients.get(user)
+            if not info:
+                continue
+            info["room"] = None
+            conn = info["conn"]
+            data = left.get(conn.framing)
+            if data is None:
+                data = left[conn.framing] = conn.framing.pack({
+                    "type": "room_left",
+                    "room": room
+                })
+            conn.send(data)
+        self.history.pop(room, None)
+        self.message_ids.pop(room, None)
+        self.invalidate_room_list()
+        self.notify_rooms("room_removed", room)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Room deleted: %s (%d members)", room, len(members),
+                        extra={"event": "room_deleted", "room": room,
+                               "members": len(members)})
+
+    def notify_rooms(self, mtype, room):
+        """Envoie un changement de la liste des salons ("room_added" ou
+        "room_removed") à tous les clients enregistrés."""
+        encoded = {}
+        for info in self.clients.values():
+            conn = info["conn"]
+            data = encoded.get(conn.framing)
+            if data is None:
+                data = encoded[conn.framing] = conn.framing.pack({
+                    "type": mtype,
+                    "room": room
+                })
+            conn.send(data)
+
+    @action("join_room")
+    async def handle_join_room(self, msg, conn):
+        username = conn.username
         if not username:
-            await self.send_error(writer, "register first")
+            await self.send_error(conn, "register first")
             return
 
         room = msg.get("room")
         if not room:
-            await self.send_error(writer, "room name required")
+            await self.send_error(conn, "room name required")
             return
 
         if room not in self.rooms:
-            await self.send_error(writer, "room does not exist")
+            await self.send_error(conn, "room does not exist")
             return
 
         # quitter l'ancien salon
@@ -173,15 +854,21 @@ class ChatServer:
         self.rooms[room].add(username)
         self.clients[username]["room"] = room
 
-        await self.send_json(writer, {
+        await self.send_json(conn, {
             "type": "room_joined",
             "room": room
         })
-        logger.info(f"{username} joined room {room}")
+        self.replay_history(room, conn)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s joined room %s", username, room,
+                        extra={"event": "join", "user": username,
+                               "room": room})
 
-    async def handle_leave_room(self, writer, username):
+    @action("leave_room")
+    async def handle_leave_room(self, msg, conn):
+        username = conn.username
         if not username:
-            await self.send_error(writer, "register first")
+            await self.send_error(conn, "register first")
             return
 
         current_room = self.clients[username]["room"]
@@ -189,58 +876,272 @@ class ChatServer:
             self.rooms[current_room].remove(username)
             self.clients[username]["room"] = None
 
-            await self.send_json(writer, {
+            await self.send_json(conn, {
                 "type": "room_left",
                 "room": current_room
             })
-            logger.info(f"{username} left room {current_room}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("%s left room %s", username, current_room,
+                            extra={"event": "leave", "user": username,
+                                   "room": current_room})
         else:
-            await self.send_error(writer, "not in a room")
+            await self.send_error(conn, "not in a room")
 
-    async def handle_send_message(self, msg, writer, username):
+    @action("send_message")
+    async def handle_send_message(self, msg, conn):
+        username = conn.username
         if not username:
-            await self.send_error(writer, "register first")
+            await self.send_error(conn, "register first")
             return
 
         text = msg.get("message")
         if not text:
-            await self.send_error(writer, "message required")
+            await self.send_error(conn, "message required")
             return
 
         room = self.clients[username]["room"]
         if not room:
-            await self.send_error(writer, "join a room first")
+            await self.send_error(conn, "join a room first")
             return
 
-        logger.info(f"Message from {username} in {room}: {text}")
-        await self.broadcast_room(room, {
+        if logger.isEnabledFor(logging.INFO) and self.message_log.allow():
+            skipped = self.message_log.take_suppressed()
+            extra = {"event": "message", "user": username, "room": room,
+                     "text": text, "skipped": skipped}
+            if skipped:
+                logger.info("Message from %s in %s: %s (%d messages not logged)",
+                            username, room, text, skipped, extra=extra)
+            else:
+                logger.info("Message from %s in %s: %s", username, room, text,
+                            extra=extra)
+        payload = {
             "type": "chat_message",
             "room": room,
             "from": username,
             "message": text
+        }
+        if self.bus is None:
+            # en mode --workers, chaque worker a son propre compteur : pas
+            # d'id plutôt que des ids en double ou dans le désordre
+            self.message_ids[room] += 1
+            payload["id"] = self.message_ids[room]
+        await self.broadcast_room(room, payload)
+
+    @action("fetch_history")
+    async def handle_fetch_history(self, msg, conn):
+        username = conn.username
+        if not username:
+            await self.send_error(conn, "register first")
+            return
+
+        if self.bus is not None:
+            # les messages n'ont pas d'id en mode --workers (voir
+            # handle_send_message) : pas de curseur possible
+            await self.send_error(conn, "history paging not available "
+                                        "with --workers")
+            return
+
+        room = msg.get("room") or self.clients[username]["room"]
+        if not room:
+            await self.send_error(conn, "join a room first")
+            return
+        if room not in self.rooms:
+            await self.send_error(conn, "room does not exist")
+            return
+
+        before = msg.get("before")
+        limit = msg.get("limit", DEFAULT_PAGE_SIZE)
+        if before is not None and (not isinstance(before, int)
+                                   or isinstance(before, bool)):
+            await self.send_error(conn, "invalid cursor")
+            return
+        if (not isinstance(limit, int) or isinstance(limit, bool)
+                or not 1 <= limit <= MAX_PAGE_SIZE):
+            await self.send_error(conn, "invalid limit")
+            return
+
+        page, more = self.history_page(room, before, limit)
+        conn.send(self.pack_history(conn.framing, room, page, more))
+
+    def history_page(self, room, before, limit):
+        """Messages d'id < before (tous si None), du plus ancien au plus récent.
+
+        Retourne ([(id, octets JSON)], il en reste de plus anciens). Avec
+        --data-dir, lecture directe dans le journal via son index ; sinon,
+        dans l'historique en mémoire (seulement ses derniers messages).
+        """
+        log = self.store.rooms.get(room) if self.store is not None else None
+        if log is not None:
+            if before is None:
+                before = log.last_id + 1
+            page = log.before(before, limit)
+            return page, bool(page) and page[0][0] > log.first_id
+        entries = [payload for payload, _ in self.history.get(room, ())
+                   if "id" in payload
+                   and (before is None or payload["id"] < before)]
+        page = [(payload["id"], self.codec.dumps(payload))
+                for payload in entries[-limit:]]
+        return page, len(entries) > limit
+
+    def pack_history(self, framing, room, page, more):
+        """Encode une réponse "history" tenant dans une trame de `framing`.
+
+        Les messages sont déjà en JSON : en NDJSON on les concatène tels
+        quels, sans décodage. Si la page dépasse la taille de trame, on
+        n'en garde que les plus récents (le client redemandera la suite).
+        """
+        cursor = page[0][0] if page else None
+        while True:
+            if framing.codec.binary:
+                data = framing.pack({
+                    "type": "history",
+                    "room": room,
+                    "messages": [self.codec.loads(body) for _, body in page],
+                    "before": cursor,
+                    "more": more
+                })
+            else:
+                data = framing.frame(
+                    b'{"type":"history","room":' + self.codec.dumps(room)
+                    + b',"messages":[' + b",".join(body for _, body in page)
+                    + b'],"before":' + self.codec.dumps(cursor)
+                    + b',"more":' + (b"true" if more else b"false") + b"}")
+            if len(data) <= framing.max_frame or not page:
+                return data
+            # le curseur avance même si plus aucun message ne tient
+            half = max(1, len(page) // 2)
+            dropped, page = page[:half], page[half:]
+            cursor, more = page[0][0] if page else dropped[-1][0], True
+
+    def check_admin(self, msg):
+        """True si le message porte le jeton d'administration attendu."""
+        token = msg.get("token")
+        if not self.admin_token or not isinstance(token, str):
+            return False
+        return hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    @action("delete_room")
+    async def handle_delete_room(self, msg, conn):
+        if not self.check_admin(msg):
+            await self.send_error(conn, "not authorized")
+            return
+
+        room = msg.get("room")
+        if not room:
+            await self.send_error(conn, "room name required")
+            return
+        if room == "general":
+            await self.send_error(conn, "cannot delete the default room")
+            return
+        if room not in self.rooms:
+            await self.send_error(conn, "room does not exist")
+            return
+
+        await self.remove_room(room)
+        if self.bus:
+            self.bus.delete_room(room)
+        await self.send_json(conn, {
+            "type": "info",
+            "message": f"Room '{room}' deleted"
+        })
+
+    @action("admin_profile")
+    async def handle_admin_profile(self, msg, conn):
+        if not self.check_admin(msg):
+            await self.send_error(conn, "not authorized")
+            return
+
+        if msg.get("stop"):
+            try:
+                path = self.profiler.stop()
+            except OSError as e:
+                await self.send_error(conn, f"could not write profile: {e}")
+                return
+            if path is None:
+                await self.send_error(conn, "profiler not running")
+                return
+            await self.send_json(conn, {
+                "type": "info",
+                "message": f"Profile written to {path}",
+                "path": path
+            })
+            return
+
+        try:
+            seconds = float(msg.get("seconds", DEFAULT_PROFILE_SECONDS))
+        except (TypeError, ValueError):
+            seconds = float("nan")
+        if not seconds > 0:
+            await self.send_error(conn, "invalid seconds")
+            return
+        try:
+            self.profiler.start(seconds)
+        except RuntimeError:
+            await self.send_error(conn, "profiler already running")
+            return
+        await self.send_json(conn, {
+            "type": "info",
+            "message": f"Profiling for {seconds:g} s"
         })
 
     async def broadcast_room(self, room, payload):
+        self.deliver_room(room, payload)
+        if self.store is not None and "id" in payload:
+            # simple mise en attente : l'écriture se fait par lots en fond
+            self.store.append(room, payload["id"], payload)
+        if self.bus:
+            self.bus.publish(room, payload)
+
+    def replay_history(self, room, conn):
+        """Remet en file les derniers messages du salon pour un arrivant."""
+        framing = conn.framing
+        for payload, encoded in self.history.get(room, ()):
+            data = encoded.get(framing)
+            if data is None:
+                data = encoded[framing] = framing.pack(payload)
+            if len(data) <= framing.max_frame:
+                conn.send(data)
+
+    def deliver_room(self, room, payload):
+        """Livre un message aux membres du salon connectés à ce processus."""
+        start = time.perf_counter()
         users = self.rooms.get(room, set())
-        data = (json.dumps(payload) + "\n").encode()
+        # encodé une seule fois par framing présent dans le salon
+        encoded = {}
+        # simple mise en file : chaque tâche d'écriture vide son propre buffer
+        # (les pertes sont comptées dans conn.dropped, pas de log par message)
         for user in users:
-            writer = self.clients[user]["writer"]
-            try:
-                writer.write(data)
-                await writer.drain()
-            except Exception:
-                logger.warning(f"Failed to send to {user}")
-
-    async def send_error(self, writer, message):
-        await self.send_json(writer, {
-            "type": "error",
-            "message": message
-        })
+            conn = self.clients[user]["conn"]
+            data = encoded.get(conn.framing)
+            if data is None:
+                data = encoded[conn.framing] = conn.framing.pack(payload)
+            # un gros message envoyé en mode "length" ne doit pas casser
+            # la connexion d'un membre resté en NDJSON
+            if len(data) > conn.framing.max_frame:
+                conn.dropped += 1
+                continue
+            conn.send(data)
+        # on garde les encodages produits pour le rejeu (voir replay_history)
+        history = self.history.get(room)
+        if history is not None and history.maxlen:
+            history.append((payload, encoded))
+        self.fanout_stats.observe(time.perf_counter() - start)
 
-    async def send_json(self, writer, payload):
-        data = (json.dumps(payload) + "\n").encode()
-        writer.write(data)
-        await writer.drain()
+    async def send_error(self, conn, message):
+        key = (conn.framing, message)
+        data = self._error_data.get(key)
+        if data is None:
+            data = conn.framing.pack({
+                "type": "error",
+                "message": message
+            })
+            # cache borné : certains messages reprennent des valeurs du client
+            if len(self._error_data) < MAX_CACHED_ERRORS:
+                self._error_data[key] = data
+        conn.send(data)
+
+    async def send_json(self, conn, payload):
+        conn.send(conn.framing.pack(payload))
 
     async def cleanup_client(self, username):
         info = self.clients.pop(username, None)
@@ -250,24 +1151,339 @@ class ChatServer:
         room = info["room"]
         if room and username in self.rooms.get(room, set()):
             self.rooms[room].remove(username)
-        logger.info(f"Cleaned up client {username}")
+        if self.bus:
+            self.bus.release_user(username)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Cleaned up client %s", username,
+                        extra={"event": "cleanup", "user": username})
 
+    # --- métriques (endpoint HTTP, voir metrics.py) ---
+
+    def out_totals(self):
+        """Messages/octets écrits et messages perdus, depuis le départ."""
+        totals = collections.Counter(self._closed_out)
+        for conn in self.connections:
+            totals["messages"] += conn.messages_out
+            totals["bytes"] += conn.bytes_out
+            totals["dropped"] += conn.dropped
+        return totals
+
+    def render_metrics(self):
+        """État du serveur au format texte de Prometheus."""
+        out = self.out_totals()
+        page = Exposition()
+        page.gauge("chat_connections", "Open client connections.",
+                   len(self.connections))
+        page.gauge("chat_clients", "Registered clients.", len(self.clients))
+        page.gauge("chat_slow_clients",
+                   "Connections above the write buffer high-water mark.",
+                   self.slow_clients)
+        page.gauge("chat_rooms", "Known rooms.", len(self.rooms))
+        page.header("chat_room_members", "gauge",
+                    "Local members of each room.")
+        for room, users in self.rooms.items():
+            page.sample("chat_room_members", len(users), {"room": room})
+        page.counter("chat_messages_received_total",
+                     "Frames received from clients.", self.messages_in)
+        page.counter("chat_received_bytes_total",
+                     "Bytes of frames received from clients.", self.bytes_in)
+        page.counter("chat_messages_sent_total",
+                     "Messages written to clients.", out["messages"])
+        page.counter("chat_sent_bytes_total",
+                     "Bytes written to clients.", out["bytes"])
+        page.counter("chat_messages_dropped_total",
+                     "Messages dropped by full queues or size limits.",
+                     out["dropped"])
+        page.header("chat_evictions_total", "counter",
+                    "Clients disconnected for being too slow.")
+        for reason, count in self.evictions.items():
+            page.sample("chat_evictions_total", count, {"reason": reason})
+        page.histogram("chat_fanout_seconds",
+                       "Time to queue a room message to its local members.",
+                       [(None, self.fanout_stats)])
+        page.histogram("chat_action_seconds", "Action handler duration.",
+                       [({"action": name}, hist)
+                        for name, hist in self.action_stats.items()])
+        page.gauge("chat_event_loop_lag_last_seconds",
+                   "Last measured event loop lag.", self.loop_lag)
+        page.histogram("chat_event_loop_lag_seconds", "Event loop lag.",
+                       [(None, self.loop_lag_stats)])
+        page.header("chat_event_loop_lag_spikes_total", "counter",
+                    "Lag measurements above the threshold, by slowest action.")
+        for name, count in self.lag_spikes.items():
+            page.sample("chat_event_loop_lag_spikes_total", count,
+                        {"action": name})
+        page.header("chat_slow_callbacks_total", "counter",
+                    "Slow callbacks reported by asyncio debug mode, "
+                    "by last started action.")
+        for name, count in self.slow_callbacks.items():
+            page.sample("chat_slow_callbacks_total", count, {"action": name})
+        return page.text()
+
+    # --- événements venant des autres workers (voir bus.py) ---
+
+    def on_bus_rooms(self, rooms, history):
+        for room in rooms:
+            self.add_room(room, history.get(room))
+
+    def on_bus_room_created(self, room, history=None):
+        self.add_room(room, history)
+
+    async def on_bus_room_deleted(self, room):
+        await self.remove_room(room)
+
+    async def on_bus_broadcast(self, room, payload):
+        self.deliver_room(room, payload)
+
+
+def loop_factory(name):
+    """Fabrique de boucle pour asyncio.run() : (factory, nom effectif).
+
+    "auto" prend uvloop s'il est installé ; "uvloop" aussi, mais prévient
+    quand il manque. Dans les deux cas on retombe sur la boucle asyncio.
+    """
+    if name in ("auto", "uvloop") and uvloop is not None:
+        return uvloop.new_event_loop, "uvloop"
+    if name == "uvloop":
+        logger.warning("uvloop is not installed, using the asyncio event loop")
+    return None, "asyncio"
+
+
+def loop_name(loop):
+    """Nom lisible de l'implémentation d'une boucle ("asyncio", "uvloop")."""
+    return type(loop).__module__.split(".")[0]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur de chat multi-utilisateurs")
+    parser.add_argument("--host", default="0.0.0.0",
+                        help="interface d'écoute (défaut : toutes)")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="taille max de la file de sortie par client")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES,
+                        default=DROP_OLDEST,
+                        help="politique quand la file d'un client est pleine")
+    parser.add_argument("--buffer-high", type=int, default=DEFAULT_BUFFER_HIGH,
+                        help="octets en attente au-delà desquels un client est lent")
+    parser.add_argument("--buffer-low", type=int, default=DEFAULT_BUFFER_LOW,
+                        help="octets en attente sous lesquels il redevient normal")
+    parser.add_argument("--slow-timeout", type=float,
+                        default=DEFAULT_SLOW_TIMEOUT,
+                        help="secondes de lenteur avant expulsion")
+    parser.add_argument("--codec", choices=("auto", *CODECS), default="auto",
+                        help="bibliothèque JSON (auto : la plus rapide installée)")
+    parser.add_argument("--max-frame", type=int, default=DEFAULT_MAX_FRAME,
+                        help="taille max d'un message en framing \"length\"")
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG,
+                        help="taille de la file des connexions en attente")
+    parser.add_argument("--core", choices=CORES, default="stream",
+                        help="implémentation réseau du serveur")
+    parser.add_argument("--loop", choices=("auto", "asyncio", "uvloop"),
+                        default="auto",
+                        help="boucle d'événements (auto : uvloop si installé)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="nombre de processus (SO_REUSEPORT + bus local)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="port HTTP des métriques Prometheus (défaut : aucun)")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="interface d'écoute des métriques")
+    parser.add_argument("--lag-threshold", type=float,
+                        default=DEFAULT_LAG_THRESHOLD * 1000,
+                        help="retard de boucle signalé, en ms (et seuil des "
+                             "callbacks lents)")
+    parser.add_argument("--loop-debug", action="store_true",
+                        help="mode debug d'asyncio : signale chaque callback "
+                             "plus long que --lag-threshold (coûteux)")
+    parser.add_argument("--history-size", type=int,
+                        default=DEFAULT_HISTORY_SIZE,
+                        help="messages gardés par salon et rejoués à "
+                             "l'arrivée (défaut des nouveaux salons)")
+    parser.add_argument("--data-dir",
+                        help="dossier du journal des messages (sans : rien "
+                             "n'est conservé au redémarrage)")
+    parser.add_argument("--segment-size", type=int,
+                        default=DEFAULT_SEGMENT_BYTES,
+                        help="taille max d'un segment du journal (octets)")
+    parser.add_argument("--fsync", action="store_true",
+                        help="fsync après chaque écriture groupée du journal")
+    parser.add_argument("--admin-token",
+                        default=os.environ.get("CHAT_ADMIN_TOKEN"),
+                        help="jeton des actions admin (défaut : "
+                             "$CHAT_ADMIN_TOKEN ; sans jeton, désactivées)")
+    parser.add_argument("--profile-dir",
+                        help="dossier des profils cProfile (défaut : /tmp)")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    parser.add_argument("--message-log-rate", type=float,
+                        default=DEFAULT_MESSAGE_LOG_RATE,
+                        help="messages de chat journalisés par seconde (0 : aucun)")
+    parser.add_argument("--log-format", choices=tuple(FORMATTERS),
+                        default="text",
+                        help="text, kv (clé=valeur) ou json (une ligne par log)")
+    parser.add_argument("--sync-logging", action="store_true",
+                        help="écrit les logs depuis la boucle (sans thread dédié)")
+    args = parser.parse_args(argv)
+    if args.buffer_low > args.buffer_high:
+        parser.error("--buffer-low must not exceed --buffer-high")
+    if args.profile_dir:
+        # mieux vaut le savoir au démarrage qu'en perdant un profil
+        try:
+            os.makedirs(args.profile_dir, exist_ok=True)
+        except OSError as e:
+            parser.error(f"--profile-dir: {e}")
+        if not os.access(args.profile_dir, os.W_OK | os.X_OK):
+            parser.error(f"--profile-dir: {args.profile_dir} is not writable")
+    return args
+
+
+def configure_logging(args):
+    return setup_logging(args.log_level, use_queue=not args.sync_logging,
+                         fmt=args.log_format)
+
+
+def build_server(args, **kwargs):
+    kwargs.setdefault("metrics_port", args.metrics_port)
+    if args.data_dir:
+        kwargs["store"] = MessageLog(args.data_dir, get_codec(args.codec),
+                                     args.segment_size, args.fsync)
+    return ChatServer(host=args.host, port=args.port,
+                      max_queue=args.queue_size, overflow=args.overflow,
+                      buffer_high=args.buffer_high,
+                      buffer_low=args.buffer_low,
+                      slow_timeout=args.slow_timeout,
+                      codec=get_codec(args.codec),
+                      max_frame=args.max_frame, core=args.core,
+                      backlog=args.backlog,
+                      message_log_rate=args.message_log_rate,
+                      metrics_host=args.metrics_host,
+                      lag_threshold=args.lag_threshold / 1000,
+                      loop_debug=args.loop_debug,
+                      admin_token=args.admin_token,
+                      profile_dir=args.profile_dir,
+                      history_size=args.history_size, **kwargs)
+
+
+def cancel_on_sigterm():
+    """SIGTERM (systemd, Popen.terminate()) annule la tâche courante.
+
+    L'arrêt passe alors par le même chemin que Ctrl+C : clients fermés et
+    journal des messages vidé sur disque avant de quitter.
+    """
+    if not hasattr(signal, "SIGTERM"):
+        return
+    task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                      task.cancel)
+    except (NotImplementedError, RuntimeError):
+        # Windows, ou hors du thread principal
+        pass
+
+
+async def run_worker(args, bus_path, index=0):
+    """Un worker : ChatServer sur le port partagé, relié aux autres par le bus."""
+    cancel_on_sigterm()
+    # un port de métriques par worker : --metrics-port + index
+    metrics_port = None
+    if args.metrics_port is not None:
+        metrics_port = args.metrics_port + index
+    server = build_server(args, reuse_port=True, metrics_port=metrics_port)
+    server.bus = BusClient(server)
+    await server.bus.connect(bus_path)
+
+    serving = asyncio.create_task(server.start())
+    await asyncio.wait({serving, server.bus.closed},
+                       return_when=asyncio.FIRST_COMPLETED)
+    if not serving.done():
+        # sans bus, ce worker livrerait des salons incomplets
+        logger.error("Lost connection to the bus, stopping worker")
+        serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
 
-async def main():
-    # écouter sur toutes les interfaces pour que les autres machines puissent se connecter
-    server = ChatServer(host="0.0.0.0", port=8888)
+
+def worker_main(args, bus_path, index=0):
+    """Point d'entrée d'un processus worker."""
+    # processus lancé en "spawn" : la configuration du parent n'est pas héritée
+    configure_logging(args)
+    factory, _ = loop_factory(args.loop)
+    try:
+        asyncio.run(run_worker(args, bus_path, index), loop_factory=factory)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+async def run_workers(args):
+    """Mode multi-processus : N workers SO_REUSEPORT + le hub du bus ici."""
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("--workers needs SO_REUSEPORT and Unix sockets")
+    if args.data_dir:
+        # chaque worker numérote ses messages : un seul écrivain par journal
+        raise SystemExit("--data-dir is not supported with --workers")
+
+    with tempfile.TemporaryDirectory(prefix="chat-bus-") as tmp:
+        bus_path = os.path.join(tmp, "bus.sock")
+        ctx = multiprocessing.get_context("spawn")
+        workers = [
+            ctx.Process(target=worker_main, args=(args, bus_path, i),
+                        name=f"chat-worker-{i}", daemon=True)
+            for i in range(args.workers)
+        ]
+        for proc in workers:
+            proc.start()
+        logger.info("Started %d workers on port %d", args.workers, args.port)
+        # le profilage se fait par worker : sans ce handler, SIGUSR1 sur le
+        # parent tuerait le hub, et avec lui tous les workers
+        if hasattr(signal, "SIGUSR1"):
+            pids = ", ".join(str(proc.pid) for proc in workers)
+
+            def on_sigusr1():
+                logger.warning("SIGUSR1 ignored by the parent process; "
+                               "send it to a worker: %s", pids,
+                               extra={"event": "sigusr1_ignored"})
+
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1,
+                                                          on_sigusr1)
+        hub = asyncio.create_task(BusHub(bus_path).serve())
+        try:
+            # shield : à l'arrêt, le hub doit survivre aux workers, sinon
+            # il attend leurs connexions au bus et eux l'attendent
+            await asyncio.shield(hub)
+        finally:
+            for proc in workers:
+                proc.terminate()
+            await asyncio.to_thread(lambda: [proc.join() for proc in workers])
+            hub.cancel()
+            await asyncio.gather(hub, return_exceptions=True)
+
+
+async def main(args=None):
+    if args is None:
+        args = parse_args()
+    cancel_on_sigterm()
 
     ip_locale = get_local_ip()
     print("Serveur de chat démarré.")
     print(f"Adresse IP de cette machine (à utiliser dans le client) : {ip_locale}")
-    print(f"Port : {server.port}")
-    print(f"Dans le client, entre IP = {ip_locale} et Port = {server.port}")
+    print(f"Port : {args.port}")
+    print(f"Dans le client, entre IP = {ip_locale} et Port = {args.port}")
+
+    if args.workers > 1:
+        await run_workers(args)
+        return
 
+    # écouter sur toutes les interfaces pour que les autres machines puissent se connecter
+    server = build_server(args)
     await server.start()
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    configure_logging(args)
+    factory, _ = loop_factory(args.loop)
     try:
-        asyncio.run(main())
+        asyncio.run(main(args), loop_factory=factory)
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
+    except asyncio.CancelledError:
+        logger.info("Server stopped (SIGTERM)")